@@ -1,23 +1,144 @@
 import os
-from utils import settings
+import gzip
+import json
+import logging
+import threading
+import time
+from utils import settings, progress, index
 from utils.base_logger import logger
+from api import scheduler
+from file_handler import preprocessor
 import requests
 
 
+class RemoteStateCache:
+    """
+    TTL cache of remote listings (knowledge collections, uploaded files).
+
+    Entries are keyed by the listing URL and kept for settings.cache_ttl seconds.
+    When settings.cache_file is set, the entries are also written to and read from
+    a JSON snapshot so that consecutive runs can reuse fresh listings.
+    """
+
+    def __init__(self, ttl, snapshot_file=None):
+        self.ttl = ttl
+        self.snapshot_file = snapshot_file
+        self.entries = {}
+        # reentrant, set() and update() call save() and get() while holding it
+        self.lock = threading.RLock()
+        self.load()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry["fetched_at"] > self.ttl:
+                logger.debug(f"Cache expired for {key}")
+                self.entries.pop(key, None)
+                return None
+            logger.debug(f"Cache hit for {key}")
+            return entry["data"]
+
+    def set(self, key, data):
+        if self.ttl <= 0:
+            return
+        with self.lock:
+            self.entries[key] = {"fetched_at": time.time(), "data": data}
+            self.save()
+
+    def update(self, key, func):
+        """
+        Apply func to the cached data in place, keeping its original timestamp.
+        Nothing happens when the key is not cached (or already expired).
+
+        Call save() once the batch of updates is done.
+        """
+        with self.lock:
+            data = self.get(key)
+            if data is not None:
+                func(data)
+
+    def invalidate(self, key=None):
+        with self.lock:
+            if key is None:
+                self.entries = {}
+            else:
+                self.entries.pop(key, None)
+            self.save()
+
+    def load(self):
+        if self.snapshot_file is None or not os.path.exists(self.snapshot_file):
+            return
+        try:
+            with open(self.snapshot_file, "r") as entrada:
+                self.entries = json.load(entrada)
+            logger.debug(f"Remote state cache loaded from {self.snapshot_file}")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable cache snapshot: {e}")
+            self.entries = {}
+
+    def save(self):
+        if self.snapshot_file is None:
+            return
+        tmp_file = f"{self.snapshot_file}.tmp"
+        try:
+            with self.lock:
+                with open(tmp_file, "w") as salida:
+                    json.dump(self.entries, salida)
+                os.replace(tmp_file, self.snapshot_file)
+        except OSError as e:
+            logger.warning(f"Failed to write cache snapshot: {e}")
+
+
+# a single cache shared by every handler created in this process
+_remote_cache = None
+
+
+def get_remote_cache():
+    global _remote_cache
+    if _remote_cache is None:
+        _remote_cache = RemoteStateCache(settings.cache_ttl, settings.cache_file)
+    return _remote_cache
+
+
+# environment variables from env_file, loaded once per process
+_env = None
+
+
+def load_env():
+    global _env
+    if _env is None:
+        env = {}
+        logger.debug(f"Loading environment variables from {settings.env_file}")
+        with open(os.path.join(os.getcwd(), settings.env_file), "r") as entrada:
+            logger.debug(f"Looking for OWUI_HOSTNAME and OWUI_API_KEY")
+            for line in entrada:
+                line = line.strip()
+                if not line.startswith("#") and "=" in line:
+                    key, value = line.split("=", 1)
+                    env[key] = value
+        _env = env
+    return _env
+
+
+# a single handler shared by every section of a run
+_handler = None
+
+
+def get_handler():
+    global _handler
+    if _handler is None:
+        _handler = OWUIHandler()
+    return _handler
+
+
 class OWUIHandler:
     def __init__(self):
         logger.debug("Initializing OWUIHandler...")
         try:
-            env = {}
             # load environment variables from env_file
-            logger.debug(f"Loading environment variables from {settings.env_file}")
-            with open(os.path.join(os.getcwd(), settings.env_file), "r") as entrada:
-                logger.debug(f"Looking for OWUI_HOSTNAME and OWUI_API_KEY")
-                for line in entrada:
-                    line = line.strip()
-                    if not line.startswith("#") and "=" in line:
-                        key, value = line.split("=", 1)
-                        env[key] = value
+            env = load_env()
             owui_hostname = env.get("OWUI_HOSTNAME")
             owui_api_key = env.get("OWUI_API_KEY")
             self.base_url = f"https://{owui_hostname}"
@@ -27,6 +148,22 @@ class OWUIHandler:
             }
             logger.debug("Environment variables loaded")
             self.knowledge_id = 0
+            self.cache = get_remote_cache()
+            # keep connections alive across requests, sized for concurrent
+            # uploads and for the reconcile workers
+            self.session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_maxsize=max(
+                    10, settings.upload_workers, settings.reconcile_workers
+                )
+            )
+            self.session.mount("https://", adapter)
+            self.compress_uploads = settings.upload_compression
+            self.url_collections = self.base_url + "/api/v1/knowledge/list"
+            self.url_files = self.base_url + "/api/v1/files/"
+            # file objects returned on upload, used to keep cached collections
+            # current, until add_files_to_knowledge adds them
+            self.uploaded_files = {}
         except FileNotFoundError as e:
             logger.error(f"{e}")
             raise
@@ -35,7 +172,7 @@ class OWUIHandler:
         api_endpoint = "/api/v1/auths/"
         url = self.base_url + api_endpoint
         try:
-            with requests.get(url, headers=self.headers) as response:
+            with self.session.get(url, headers=self.headers) as response:
                 if response.status_code == 200:
                     pass
         except requests.exceptions.RequestException as e:
@@ -44,18 +181,27 @@ class OWUIHandler:
 
         return 0
 
-    def get_knowledge_collections(self):
-        api_endpoint = "/api/v1/knowledge/list"
-        url = self.base_url + api_endpoint
+    def get_knowledge_collections(self, refresh=False):
+        url = self.url_collections
+        if not refresh:
+            collections = self.cache.get(url)
+            if collections is not None:
+                return collections
+
         try:
-            with requests.get(url, headers=self.headers) as response:
+            with self.session.get(url, headers=self.headers) as response:
                 if response.status_code == 200:
                     pass
         except requests.exceptions.RequestException as e:
             logger.error(f"Exception during get_user_session: {e}")
             raise
 
-        return response.json()
+        collections = response.json()
+        if response.status_code == 200:
+            self.cache.set(url, collections)
+            index.get_index().sync_collections(collections)
+
+        return collections
 
     def prepare_collection(self, collection_name):
         data = self.get_knowledge_collections()
@@ -87,7 +233,7 @@ class OWUIHandler:
 
         # create
         try:
-            with requests.post(url, headers=self.headers, json=payload) as response:
+            with self.session.post(url, headers=self.headers, json=payload) as response:
                 if response.status_code == 200:
                     logger.info(f"Knowledge collection {collection_name} created")
                     id_knowledge = response.json().get("id")
@@ -100,44 +246,149 @@ class OWUIHandler:
 
         logger.debug(f"Knowledge ID of the collection: {id_knowledge}")
 
+        index.get_index().record_collection(id_knowledge, collection_name)
+
+        # register the new, empty, collection in the cached listing
+        new_collection = {
+            "id": id_knowledge,
+            "name": collection_name,
+            "description": description,
+            "files": [],
+        }
+        self.cache.update(
+            self.url_collections, lambda data: data.append(new_collection)
+        )
+        self.cache.save()
+
         return id_knowledge
 
-    def upload_files(self, files):
+    def upload_file(self, file):
         # file upload api endpoint
         api_endpoint = "/api/v1/files/"
         url = self.base_url + api_endpoint
 
-        file_count = len(files)
-        logger.info(f"Start uploading files: {file_count}")
+        logger.debug("Uploading %s", file)
+        with open(file, "rb") as entrada:
+            upload_file = {"file": entrada}
+            try:
+                if self.compress_uploads:
+                    uploaded = self.upload_compressed(url, upload_file)
+                    if uploaded is not None:
+                        return uploaded
+                    entrada.seek(0)
+                with self.session.post(
+                    url, headers=self.headers, files=upload_file
+                ) as response:
+                    if response.status_code == 200:
+                        return response.json()
+                    else:
+                        logger.debug("Status code: %s", response.status_code)
+                        logger.debug("Response: %s", response.text)
+            except Exception as e:
+                logger.error(f"Exception during file upload: {e}")
+                raise
+
+        return None
+
+    def upload_compressed(self, url, upload_file):
+        """
+        Upload with a gzip-encoded request body.
+        When the server rejects the encoding, compression is turned off for
+        the remaining uploads and None is returned so the caller can resend as-is.
+        """
+        request = requests.Request("POST", url, headers=self.headers, files=upload_file)
+        prepared = self.session.prepare_request(request)
+        prepared.body = gzip.compress(prepared.body, compresslevel=6)
+        prepared.headers["Content-Encoding"] = "gzip"
+        prepared.headers["Content-Length"] = str(len(prepared.body))
+        with self.session.send(prepared) as response:
+            if response.status_code == 200:
+                return response.json()
+            logger.warning(
+                f"Compressed upload refused with status {response.status_code}, sending uncompressed from now on"
+            )
+            self.compress_uploads = False
+
+        return None
+
+    def upload_files(self, files):
+        """
+        Upload files through the size-aware UploadScheduler.
+
+        Args:
+          files: (path, size) tuples from collect_files or iter_files, or plain paths;
+            a generator is consumed as the uploads go, so they start with the first file
+
+        Returns:
+          lst_file_id: IDs of the uploaded files, in the order of files
+        """
+        return list(self.upload_files_by_path(files).values())
+
+    def upload_files_by_path(self, files):
+        """
+        Same as upload_files, for callers adding the files to several collections.
+
+        Returns:
+          file_ids: dictionary of path to the ID of the uploaded file, in the order of files
+        """
+        if isinstance(files, list):
+            file_count = len(files)
+            total_bytes = sum(file[1] for file in files if isinstance(file, tuple))
+            logger.info(f"Start uploading files: {file_count}")
+        else:
+            file_count = None
+            total_bytes = None
+            logger.info("Start uploading files as they are collected")
+        reporter = progress.ProgressReporter(
+            "Files uploaded", total=file_count, total_bytes=total_bytes
+        )
+
+        # remember the order files come in, to return the file IDs in that order
+        order = []
+
+        def consume(files):
+            for file in files:
+                order.append(file[0] if isinstance(file, tuple) else file)
+                yield file
 
         # upload files
-        lst_file_id = []
-        for i, file in enumerate(files):
-            logger.debug(f"Uploading {file}")
-            with open(file, "rb") as entrada:
-                upload_file = {"file": entrada}
-                try:
-                    with requests.post(
-                        url, headers=self.headers, files=upload_file
-                    ) as response:
-                        if response.status_code == 200:
-                            lst_file_id.append(response.json().get("id"))
-                            if i % 10 == 9:
-                                logger.info(f"Files uploaded: {i + 1}")
-                        else:
-                            logger.debug(f"Status code: {response.status_code}")
-                            logger.debug(f"Response: {response.json()}")
-                except Exception as e:
-                    logger.error(f"Exception during file upload: {e}")
-                    raise
-
-        logger.debug(f"File ID list: {lst_file_id}")
-
-        return lst_file_id
-
-    def add_files_to_knowledge(self, lst_file_id):
+        upload_scheduler = scheduler.UploadScheduler(
+            max_workers=settings.upload_workers,
+            max_inflight_bytes=settings.upload_max_inflight_bytes,
+            max_file_size=settings.upload_max_file_size,
+            window=settings.upload_window,
+        )
+        results = upload_scheduler.run(
+            consume(files), self.upload_file, lambda size: reporter.update(nbytes=size)
+        )
+        reporter.finish()
+
+        file_ids = {}
+        local_index = index.get_index()
+        for path in order:
+            uploaded = results.get(path)
+            if uploaded is not None:
+                file_ids[path] = uploaded.get("id")
+                self.uploaded_files[uploaded.get("id")] = uploaded
+                local_index.record_upload(
+                    path, uploaded.get("id"), os.path.getsize(path)
+                )
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"File ID list: {progress.summarize(list(file_ids.values()))}")
+
+        # register the uploaded files in the cached file listing
+        new_files = [self.uploaded_files[id] for id in file_ids.values()]
+        self.cache.update(self.url_files, lambda data: data.extend(new_files))
+        self.cache.save()
+
+        return file_ids
+
+    def add_files_to_knowledge(self, lst_file_id, id_knowledge=None):
         # file upload api endpoint
-        id_knowledge = self.id_knowledge
+        # the collection prepared by prepare_collection unless given
+        if id_knowledge is None:
+            id_knowledge = self.id_knowledge
         api_endpoint = f"/api/v1/knowledge/{id_knowledge}/file/add"
         url = self.base_url + api_endpoint
         logger.debug(f"URL is {url}")
@@ -145,27 +396,124 @@ class OWUIHandler:
         # headers
         headers = self.headers
 
+        # files entry of the target collection in the cached listing, if any
+        col_files = []
+        collections = self.cache.get(self.url_collections)
+        for col in collections or []:
+            if col.get("id") == id_knowledge:
+                col_files = col.setdefault("files", [])
+
         # add files one by one
         # NOTE: could not figure out 405 error with the batch adds using /api/v1/knowledge/{id}/files/batch/add
         # even though the payload was in json (list) containing dictionaries of file_id values
-        for i, id in enumerate(lst_file_id):
+        reporter = progress.ProgressReporter(
+            "Files added to the collection", total=len(lst_file_id)
+        )
+        added = []
+        for id in lst_file_id:
             payload = {"file_id": id}
-            logger.debug(f"Payload: {payload}")
-            with requests.post(url, headers=headers, json=payload) as response:
+            logger.debug("Payload: %s", payload)
+            with self.session.post(url, headers=headers, json=payload) as response:
                 response.raise_for_status()
                 if response.status_code == 200:
-                    if i % 10 == 9:
-                        logger.info(f"Files added to the collection: {i + 1}")
+                    # dropped once added, a long-running daemon keeps no history
+                    col_files.append(self.uploaded_files.pop(id, None) or {"id": id})
+                    added.append(id)
+                    reporter.update()
+        reporter.finish()
+        index.get_index().record_memberships(id_knowledge, added)
+
+        self.cache.save()
 
         return 0
 
-    def get_files(self):
-        # file list endpoint
-        api_endpoint = "/api/v1/files/"
+    def remove_files_from_knowledge(self, lst_file_id, id_knowledge):
+        # file removal api endpoint
+        api_endpoint = f"/api/v1/knowledge/{id_knowledge}/file/remove"
         url = self.base_url + api_endpoint
+        logger.debug(f"URL is {url}")
 
+        reporter = progress.ProgressReporter(
+            "Files removed from the collection", total=len(lst_file_id)
+        )
+        removed = set()
         try:
-            with requests.get(url, headers=self.headers) as response:
+            for id in lst_file_id:
+                payload = {"file_id": id}
+                logger.debug("Payload: %s", payload)
+                with self.session.post(
+                    url, headers=self.headers, json=payload
+                ) as response:
+                    response.raise_for_status()
+                    removed.add(id)
+                    reporter.update()
+        finally:
+            reporter.finish()
+            index.get_index().remove_memberships(id_knowledge, removed)
+
+            # drop the removed entries from the cached collection listing
+            def remove_entries(data):
+                for col in data:
+                    if col.get("id") == id_knowledge:
+                        col["files"] = [
+                            file
+                            for file in col.get("files") or []
+                            if file.get("id") not in removed
+                        ]
+
+            self.cache.update(self.url_collections, remove_entries)
+            self.cache.save()
+
+        return 0
+
+    def remove_uploaded_paths(self, paths, id_knowledge=None, keep=()):
+        """
+        Remove from the collection the files uploaded from the given local paths,
+        except the file IDs in keep. Parts of a preprocessed document match the
+        document they were split from, so a shorter version leaves no extra part.
+
+        Args:
+          paths: local paths, as recorded when uploading
+          id_knowledge: collection ID, the one prepared by prepare_collection if None
+          keep: file IDs to leave in the collection
+        """
+        if id_knowledge is None:
+            id_knowledge = self.id_knowledge
+        origins = {preprocessor.part_origin(path) for path in paths}
+        keep = set(keep)
+        uploaded = index.get_index().uploaded_paths(id_knowledge)
+        stale = [
+            file_id
+            for file_id, path in uploaded.items()
+            if file_id not in keep and preprocessor.part_origin(path) in origins
+        ]
+        if stale:
+            logger.info(f"Removing {len(stale)} earlier uploads of these files")
+            self.remove_files_from_knowledge(stale, id_knowledge)
+
+        return 0
+
+    def replace_uploaded_files(self, lst_file_id, id_knowledge=None):
+        """
+        Remove the earlier uploads of the paths the given file IDs were uploaded from.
+        """
+        if id_knowledge is None:
+            id_knowledge = self.id_knowledge
+        uploaded = index.get_index().uploaded_paths(id_knowledge)
+        paths = [uploaded[id] for id in lst_file_id if id in uploaded]
+
+        return self.remove_uploaded_paths(paths, id_knowledge, keep=lst_file_id)
+
+    def get_files(self, refresh=False):
+        # file list endpoint
+        url = self.url_files
+        if not refresh:
+            files = self.cache.get(url)
+            if files is not None:
+                return files
+
+        try:
+            with self.session.get(url, headers=self.headers) as response:
                 response.raise_for_status()
                 if response.status_code == 200:
                     files = response.json()
@@ -173,6 +521,8 @@ class OWUIHandler:
             logger.error(f"Exception during get_user_session: {e}")
             raise
 
+        self.cache.set(url, files)
+
         return files
 
     def cleanup_loose_files(self, collections, files):
@@ -186,19 +536,18 @@ class OWUIHandler:
         # look into each collection found
         for col in collections:
             collection_name = col.get("name")
-            logger.debug(f"Working on collection {collection_name}")
+            logger.debug("Working on collection %s", collection_name)
 
             # get the list of file IDs in this knowledge collection
             lst_col_file_id = [col_file.get("id") for col_file in col.get("files")]
             col_file_count = len(lst_col_file_id)
             logger.debug(
-                f"Collection {collection_name} contains {col_file_count} files"
+                "Collection %s contains %d files", collection_name, col_file_count
             )
 
             # remove IDs found in the file ID list
-            for id in lst_file_id[:]:
-                if id in lst_col_file_id:
-                    lst_file_id.remove(id)
+            set_col_file_id = set(lst_col_file_id)
+            lst_file_id = [id for id in lst_file_id if id not in set_col_file_id]
 
         unused_file_count = len(lst_file_id)
         logger.debug(
@@ -206,22 +555,40 @@ class OWUIHandler:
         )
 
         # clean up DELETE requests
-        for i, id in enumerate(lst_file_id):
+        deleted = set()
+        reporter = progress.ProgressReporter("Files cleaned up", total=len(lst_file_id))
+        for id in lst_file_id:
             payload = {"id": id}
             try:
-                with requests.delete(
+                with self.session.delete(
                     url.replace("FILE_ID", id), headers=self.headers, json=payload
                 ) as response:
                     response.raise_for_status()
                     if response.status_code == 200:
-                        if i % 10 == 9:
-                            logger.info(f"Files cleaned up: {i + 1}")
+                        deleted.add(id)
+                        reporter.update()
             except requests.exceptions.RequestException as e:
                 logger.error(f"Exception during get_user_session: {e}")
+                self.drop_cached_files(deleted)
                 raise
 
+        reporter.finish()
+        self.drop_cached_files(deleted)
+
         return 0
 
+    def drop_cached_files(self, deleted):
+        # remove deleted file IDs from the cached file listing
+        if not deleted:
+            return
+        index.get_index().remove_file_ids(deleted)
+
+        def remove_deleted(data):
+            data[:] = [file for file in data if file.get("id") not in deleted]
+
+        self.cache.update(self.url_files, remove_deleted)
+        self.cache.save()
+
 
 if __name__ == "__main__":
     tmpx = None
@@ -0,0 +1,135 @@
+import os
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from utils.base_logger import logger
+
+
+class UploadScheduler:
+    """
+    Size-aware scheduler for file uploads.
+
+    A list of files is read at once; a generator is read as needed, keeping
+    at most `window` of its files pending. Work is dispatched largest-first
+    among the pending files:
+    whenever a worker is free, the largest pending file that still fits in
+    the in-flight byte budget is started, so big files do not end up last
+    and small files fill the remaining budget. A file larger than the whole
+    budget is only started when nothing else is in flight.
+    """
+
+    def __init__(
+        self, max_workers=4, max_inflight_bytes=0, max_file_size=0, window=256
+    ):
+        """
+        Args:
+          max_workers: maximum number of uploads in flight
+          max_inflight_bytes: maximum total size of the uploads in flight, 0 for no limit
+          max_file_size: files larger than this are skipped, 0 for no limit
+          window: maximum number of files read ahead from a generator to choose from
+        """
+        self.max_workers = max(1, max_workers)
+        self.max_inflight_bytes = max_inflight_bytes
+        self.max_file_size = max_file_size
+        self.window = max(1, window)
+
+    def admit(self, file):
+        """
+        Attach the size of a file, or drop it when over the size limit.
+
+        Args:
+          file: (path, size) tuple, or plain path
+
+        Returns:
+          (size, path) tuple, or None when skipped
+        """
+        if isinstance(file, tuple):
+            path, size = file
+        else:
+            path, size = file, os.path.getsize(file)
+        if self.max_file_size and size > self.max_file_size:
+            logger.warning(
+                f"Skipping {path}: {size:,} byte exceeds the upload size limit of {self.max_file_size:,} byte"
+            )
+            return None
+
+        return size, path
+
+    def run(self, files, func, progress=None):
+        """
+        Call func(path) for each file, bounded by the request and byte budgets.
+
+        Args:
+          files: iterable of (path, size) tuples, or plain paths
+          func: callable taking the file path
+          progress: optional callable taking the size of each completed file
+
+        Returns:
+          results: dictionary of path to the value returned by func
+        """
+        # a list is read ahead at once, while a generator (e.g. a collector still
+        # walking the tree) is drained as uploads go, so they start with the first file
+        streaming = not isinstance(files, (list, tuple))
+        window = self.window if streaming else len(files)
+        files = iter(files)
+        exhausted = False
+        # pending (size, path) tuples sorted by ascending size, and their sizes
+        pending = []
+        sizes = []
+        results = {}
+        in_flight = {}
+        inflight_bytes = 0
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                # read ahead up to the window, handing out work as soon as a worker is free
+                while not exhausted and len(pending) < window:
+                    file = next(files, None)
+                    if file is None:
+                        exhausted = True
+                        break
+                    item = self.admit(file)
+                    if item is not None:
+                        idx = bisect_right(sizes, item[0])
+                        sizes.insert(idx, item[0])
+                        pending.insert(idx, item)
+                        if streaming and len(in_flight) < self.max_workers:
+                            break
+
+                if not pending and not in_flight:
+                    break
+
+                # start as many uploads as the budgets allow
+                while pending and len(in_flight) < self.max_workers:
+                    if self.max_inflight_bytes:
+                        budget = self.max_inflight_bytes - inflight_bytes
+                        idx = bisect_right(sizes, budget) - 1
+                        if idx < 0:
+                            if in_flight:
+                                break
+                            # nothing fits but nothing is running either
+                            idx = len(pending) - 1
+                    else:
+                        idx = len(pending) - 1
+                    size, path = pending.pop(idx)
+                    del sizes[idx]
+                    inflight_bytes += size
+                    in_flight[executor.submit(func, path)] = (path, size)
+
+                # wait for at least one upload to finish,
+                # or just collect the finished ones while there is more to read ahead
+                if streaming and not exhausted and len(pending) < window:
+                    done, _ = wait(in_flight, timeout=0, return_when=FIRST_COMPLETED)
+                else:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path, size = in_flight.pop(future)
+                    inflight_bytes -= size
+                    results[path] = future.result()
+                    if progress is not None:
+                        progress(size)
+
+        return results
+
+
+if __name__ == "__main__":
+    tmpx = None
@@ -0,0 +1,131 @@
+import csv
+import json
+import os
+import sys
+from collections import Counter
+from utils.base_logger import logger
+
+
+class CollectionSummary:
+    """
+    Compact summary of a knowledge collection listing.
+
+    Only the aggregates used by --list are kept per collection. The raw listing
+    itself stays in the remote state cache, to be reused for settings.cache_ttl.
+    """
+
+    __slots__ = ("id", "name", "file_count", "total_size", "extensions", "newest")
+
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+        self.file_count = 0
+        self.total_size = 0
+        self.extensions = Counter()
+        self.newest = 0
+
+    def add_file(self, file):
+        meta = file.get("meta") or {}
+        self.file_count += 1
+        self.total_size += int(meta.get("size") or 0)
+        name = meta.get("name") or file.get("filename") or ""
+        self.extensions[os.path.splitext(name)[1].lower() or "(none)"] += 1
+        timestamp = file.get("updated_at") or file.get("created_at") or 0
+        if timestamp > self.newest:
+            self.newest = timestamp
+
+    def as_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "file_count": self.file_count,
+            "total_size": self.total_size,
+            "extensions": dict(self.extensions.most_common()),
+            "newest": self.newest,
+        }
+
+
+SORT_KEYS = {
+    "name": lambda summary: summary.name or "",
+    "files": lambda summary: summary.file_count,
+    "size": lambda summary: summary.total_size,
+    "newest": lambda summary: summary.newest,
+}
+
+
+def summarize_collections(collections, match=None):
+    """
+    Summarize collections in a single pass over the listing.
+
+    Args:
+      collections: list of collections returned by get_knowledge_collections
+      match: only summarize collections whose name contains this string, optional
+
+    Returns:
+      generator of CollectionSummary
+    """
+    for collection in collections:
+        name = collection.get("name")
+        if match is not None and match not in (name or ""):
+            continue
+        summary = CollectionSummary(collection.get("id"), name)
+        for file in collection.get("files") or []:
+            summary.add_file(file)
+        yield summary
+
+
+def write_summaries(summaries, output="text", sort_by=None, reverse=False):
+    """
+    Sort and print collection summaries.
+
+    Args:
+      summaries: iterable of CollectionSummary
+      output: "text" to log a human readable listing, "json" or "csv" to print to stdout
+      sort_by: one of the SORT_KEYS, None to keep the order of the listing
+      reverse: sort in descending order, or reverse the listing order
+
+    Returns:
+      list of sorted CollectionSummary
+    """
+    if sort_by is None:
+        summaries = list(summaries)
+        if reverse:
+            summaries.reverse()
+    else:
+        summaries = sorted(summaries, key=SORT_KEYS[sort_by], reverse=reverse)
+    logger.debug(f"{len(summaries)} collections summarized")
+
+    if output == "json":
+        json.dump([summary.as_dict() for summary in summaries], sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    elif output == "csv":
+        writer = csv.writer(sys.stdout)
+        writer.writerow(
+            ["id", "name", "file_count", "total_size", "extensions", "newest"]
+        )
+        for summary in summaries:
+            extensions = ";".join(
+                f"{ext}:{count}" for ext, count in summary.extensions.most_common()
+            )
+            writer.writerow(
+                [
+                    summary.id,
+                    summary.name,
+                    summary.file_count,
+                    summary.total_size,
+                    extensions,
+                    summary.newest,
+                ]
+            )
+    else:
+        for summary in summaries:
+            if summary.file_count > 0:
+                logger.info(f"Collection Name: {summary.name}")
+                logger.info(f"File Count: {summary.file_count}")
+                logger.info(f"Knowledge size: {summary.total_size:,}")
+
+    return summaries
+
+
+if __name__ == "__main__":
+    tmpx = None
@@ -8,14 +8,12 @@ import sys
 import logging
 
 # module imports
+# modules pulling in requests, zipfile, and the like are imported in the
+# sections needing them, so that --help and --list start quickly
 from utils import settings
 from utils.arguments import parse_options
 from utils.base_logger import logger
 
-from file_handler import downloader, extractor, collector
-
-from api import client
-
 
 # main function
 def main():
@@ -29,21 +27,61 @@ def main():
         logger.setLevel(logging.DEBUG)
     logger.debug(f"Arguments failed to parse: {unknown_args}")
 
+    # remote state cache configuration
+    if options.cache_ttl is not None:
+        settings.cache_ttl = options.cache_ttl
+    if options.cache_file is not None:
+        settings.cache_file = options.cache_file
+
+    # upload scheduler configuration
+    if options.upload_workers is not None:
+        settings.upload_workers = options.upload_workers
+    if options.max_inflight_bytes is not None:
+        settings.upload_max_inflight_bytes = options.max_inflight_bytes
+    if options.max_file_size is not None:
+        settings.upload_max_file_size = options.max_file_size
+    if options.preprocess:
+        settings.preprocess = True
+    if options.max_part_size is not None:
+        settings.preprocess_max_part_size = options.max_part_size
+    if options.compress:
+        settings.upload_compression = True
+
+    # delta download configuration
+    if options.git_remote is not None:
+        settings.git_remote = options.git_remote
+
+    if options.reconcile:
+        logger.debug("Executing reconcile section")
+        if options.sources is None:
+            logger.error("Provide the knowledge sources file in --sources. Exiting.")
+            sys.exit(1)
+        from api import client
+        import reconcile
+
+        reconcile.run(client.get_handler(), options.sources, dry_run=options.prepare)
+
     if options.cleanup:
         logger.debug("Executing cleanup section")
-        handler = client.OWUIHandler()
+        from api import client
+
+        handler = client.get_handler()
 
+        # files are deleted based on these listings,
+        # never rely on cached or snapshot data for them
         logger.info("Retrieve knowledge collections list")
-        collections = handler.get_knowledge_collections()
+        collections = handler.get_knowledge_collections(refresh=True)
 
         logger.info("Retrieve uploaded files list")
-        files = handler.get_files()
+        files = handler.get_files(refresh=True)
 
         logger.info("Clean up uploaded files not used in any collection")
         handler.cleanup_loose_files(collections, files)
 
     if options.download:
         logger.debug("Executing download section")
+        from file_handler import downloader, delta
+
         try:
             # identify the target knowledge source
             logger.info("Generating download URL...")
@@ -63,8 +101,19 @@ def main():
             )
             data_already_exists = downloader.compare_marker(marker)
 
+            # fetch only the files changed since the last delta download
+            if options.delta:
+                if not delta.is_git_installed():
+                    logger.error("git is required for --delta. Exiting...")
+                    sys.exit(1)
+                logger.info("Updating the knowledge source from its git mirror...")
+                state = delta.update_source(marker, options.filter, options.dir)
+                logger.info(
+                    f"Files pending upload: {len(state['changed'])}, at commit {state['commit']}"
+                )
+
             # download and extract repo zip data if the data is not yet downloaded
-            if data_already_exists:
+            elif data_already_exists:
                 logger.info("The knowledge source data is already downloaded")
             else:
                 # download the remote, public, knowledge source
@@ -80,6 +129,8 @@ def main():
                 logger.info(f"Zip file downloaded to {zip_file_path}")
 
                 # extract downloaded zip file
+                from file_handler import extractor
+
                 logger.info("Extracting zip file...")
                 extract_status = extractor.extract_zip(zip_file_path, marker)
                 if extract_status is None:
@@ -93,27 +144,27 @@ def main():
     if options.list:
         # initialization and health check
         logger.debug("Executing list section")
-        handler = client.OWUIHandler()
+        from api import client, summary
+
+        handler = client.get_handler()
         handler.get_user_session()
 
         # get existing knowledge collections
         collections = handler.get_knowledge_collections()
         logger.debug(f"{len(collections)} collections found")
 
-        if len(collections) > 0:
-            for collection in collections:
-                col_name = collection.get("name")
-                if len(collection.get("files")) > 0:
-                    file_count = len(collection.get("files"))
-                    knowledge_size = 0
-                    for file in collection.get("files"):
-                        knowledge_size += int(file["meta"]["size"])
-                    logger.info(f"Collection Name: {col_name}")
-                    logger.info(f"File Count: {file_count}")
-                    logger.info(f"Knowledge size: {knowledge_size:,}")
+        summary.write_summaries(
+            summary.summarize_collections(collections, options.match),
+            output=options.output,
+            sort_by=options.sort_by,
+            reverse=options.reverse,
+        )
 
     if options.upload:
         logger.debug("Executing upload section")
+        from file_handler import downloader, delta, collector, preprocessor
+        from api import client
+
         try:
             # ensure the collection name is provided
             # --collection_name
@@ -127,7 +178,13 @@ def main():
             if zip_url == "missing":
                 logger.error("Provide the target public GitHub repository in '--repo'.")
                 sys.exit(1)
-            data_already_exists = downloader.compare_marker(marker)
+            # a delta update leaves its own state instead of the zip marker
+            if options.delta:
+                data_already_exists = delta.is_current(
+                    marker, options.filter, options.dir
+                )
+            else:
+                data_already_exists = downloader.compare_marker(marker)
             if not data_already_exists:
                 logger.error(
                     "The requested knowledge source needs to be downloaded first. Exiting."
@@ -135,18 +192,38 @@ def main():
                 sys.exit(1)
 
             # collect target documents
+            # with --delta, only the files changed since the last upload
+            changed_files = None
+            if options.delta:
+                state = delta.load_state(marker, options.filter, options.dir)
+                changed_files = state.get("changed")
+            # files are streamed from the collector to the uploader,
+            # the collection totals are logged once every file went through
             logger.info("Collecting files...")
-            files_knowledge = collector.collect_files(
-                marker, options.filter, options.dir
+            files_knowledge = collector.iter_files(
+                marker, options.filter, options.dir, only=changed_files
             )
+            if settings.preprocess:
+                files_knowledge = preprocessor.preprocess_files(files_knowledge)
             # check if the collection already exists
             # create anew if not
             logger.info("Ensuring the knowledge collection is created...")
-            handler = client.OWUIHandler()
+            handler = client.get_handler()
             handler.prepare_collection(options.collection_name)
 
-            # stop here when --prepare switch is used
+            # drop files already uploaded to this collection with the same content
+            if options.skip_existing:
+                from utils import index
+
+                files_knowledge = index.get_index().skip_uploaded(
+                    handler.id_knowledge, files_knowledge
+                )
+
+            # stop here when --prepare switch is used,
+            # after going through the files to report their count and size
             if options.prepare:
+                for _ in files_knowledge:
+                    pass
                 logger.info("Stopping the upload actions here when --prepare is set")
                 return 0
 
@@ -155,9 +232,53 @@ def main():
             lst_file_id = handler.upload_files(files_knowledge)
             logger.info("Adding uploaded files to the knowledge collection...")
             handler.add_files_to_knowledge(lst_file_id)
+
+            if options.delta:
+                import daemon
+
+                # changed files replace their earlier uploads,
+                # and the uploads of files deleted upstream are removed
+                handler.replace_uploaded_files(lst_file_id)
+                daemon.retire(
+                    handler,
+                    options.collection_name,
+                    delta.workspace_paths(marker, state.get("deleted")),
+                    keep=lst_file_id,
+                )
+                delta.clear_pending(marker, options.filter, options.dir)
         except:
             raise
 
+    if options.index_report:
+        logger.debug("Executing index report section")
+        from utils import index
+
+        for name, count in index.get_index().report().items():
+            logger.info(f"Indexed {name}: {count:,}")
+
+    if options.daemon:
+        logger.debug("Executing daemon section")
+        from file_handler import delta
+        import daemon
+
+        if options.sources is None:
+            logger.error("Provide the knowledge sources file in --sources. Exiting.")
+            sys.exit(1)
+        # git is only needed to refresh repository sources
+        sources = daemon.load_sources(options.sources)
+        if any(source.get("repo") for source in sources) and (
+            not delta.is_git_installed()
+        ):
+            logger.error(
+                "git is required for repository sources of --daemon. Exiting..."
+            )
+            sys.exit(1)
+        daemon.run(
+            options.sources,
+            options.interval or settings.daemon_interval,
+            options.watch_interval or settings.watch_interval,
+        )
+
     return 0
 
 
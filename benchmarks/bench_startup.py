@@ -0,0 +1,89 @@
+"""Startup benchmark for Open WebUI Knowledge Manager
+
+Measure how long lightweight invocations take, and which imports dominate.
+
+    python benchmarks/bench_startup.py [--runs 20] [--budget_ms 50]
+"""
+
+# general imports
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMANDS = {
+    "interpreter": [sys.executable, "-c", "pass"],
+    "app --help": [sys.executable, "app.py", "--help"],
+    "import app": [sys.executable, "-c", "import app"],
+}
+
+
+def time_command(command, runs):
+    """
+    Run the command several times and return the wall times in milliseconds.
+    """
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=ROOT, capture_output=True)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return timings
+
+
+def top_imports(count):
+    """
+    Return the slowest imports of "import app" as reported by -X importtime.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line.split("|", 2)
+        imports.append((int(cumulative_us), name.rstrip()))
+    imports.sort(reverse=True)
+
+    return imports[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup benchmark")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument(
+        "--budget_ms",
+        type=float,
+        default=50,
+        help="Fail when app --help takes longer than this, on top of the bare interpreter.",
+    )
+    args = parser.parse_args()
+
+    medians = {}
+    for label, command in COMMANDS.items():
+        timings = time_command(command, args.runs)
+        medians[label] = statistics.median(timings)
+        print(
+            f"{label:<12} median {medians[label]:7.1f} ms  min {min(timings):7.1f} ms"
+        )
+
+    print("\nSlowest imports of 'import app' (cumulative):")
+    for cumulative_us, name in top_imports(10):
+        print(f"{cumulative_us / 1000:7.1f} ms {name}")
+
+    overhead = medians["app --help"] - medians["interpreter"]
+    print(f"\napp --help overhead: {overhead:.1f} ms (budget {args.budget_ms} ms)")
+
+    return 0 if overhead <= args.budget_ms else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""Open WebUI Knowledge Manager daemon
+
+Keep knowledge collections fresh from a long-running process, reusing one
+client and its connection pool between refreshes.
+"""
+
+# general imports
+import json
+import time
+from argparse import Namespace
+
+# module imports
+from utils import settings
+from utils.base_logger import logger
+
+from file_handler import downloader, collector, delta, preprocessor
+from file_handler.watcher import DirectoryWatcher
+
+from api import client
+
+
+def load_sources(sources_file):
+    """
+    Load the knowledge sources to keep fresh.
+
+    Args:
+      sources_file: JSON file holding a list of sources. A source is either a
+        repository, with the same keys as the command line options ("repo",
+        "branch", "tag", "release", "dir", "filter", "collection_name"), or a
+        local directory with keys "path", "filter", and "collection_name".
+
+    Returns:
+      sources: list of dictionaries
+    """
+    with open(sources_file, "r") as entrada:
+        sources = json.load(entrada)
+
+    for source in sources:
+        source.setdefault("dir", ".")
+        source.setdefault("filter", "ANY")
+        for key in ("repo", "branch", "tag", "release"):
+            source.setdefault(key, None)
+        if source.get("collection_name") is None:
+            raise ValueError(f"collection_name is missing in source {source}")
+
+    return sources
+
+
+def push(handler, collection_name, files_knowledge):
+    """
+    Upload files and add them to the collection, in place of their earlier uploads.
+
+    Returns:
+      lst_file_id: list of the file IDs added
+    """
+    if not files_knowledge:
+        return []
+    if settings.preprocess:
+        files_knowledge = preprocessor.preprocess_files(files_knowledge)
+    handler.prepare_collection(collection_name)
+    lst_file_id = handler.upload_files(files_knowledge)
+    handler.add_files_to_knowledge(lst_file_id)
+    handler.replace_uploaded_files(lst_file_id)
+
+    return lst_file_id
+
+
+def retire(handler, collection_name, deleted, keep=()):
+    """
+    Remove the uploads of deleted local files from the collection,
+    except the file IDs in keep, uploaded in the same pass.
+    """
+    if not deleted:
+        return 0
+    handler.prepare_collection(collection_name)
+    handler.remove_uploaded_paths(
+        [preprocessor.uploaded_path(path) for path in deleted], keep=keep
+    )
+
+    return 0
+
+
+def refresh_repo(handler, source):
+    """
+    Fetch the changes of a repository source and push the changed files.
+    """
+    _, marker = downloader.generate_url(Namespace(**source))
+    downloader.prepare_directory(marker)
+
+    state = delta.update_source(marker, source["filter"], source["dir"])
+    if not state.get("changed") and not state.get("deleted"):
+        return 0
+
+    lst_file_id = []
+    if state.get("changed"):
+        files_knowledge = collector.iter_files(
+            marker, source["filter"], source["dir"], only=state["changed"]
+        )
+        lst_file_id = push(handler, source["collection_name"], files_knowledge)
+    retire(
+        handler,
+        source["collection_name"],
+        delta.workspace_paths(marker, state.get("deleted")),
+        keep=lst_file_id,
+    )
+    delta.clear_pending(marker, source["filter"], source["dir"])
+
+    return 0
+
+
+def run(sources_file, interval, watch_interval):
+    """
+    Refresh repository sources every interval seconds, and push changes of
+    local directory sources every watch_interval seconds, until interrupted.
+
+    Args:
+      sources_file: JSON file of sources, see load_sources
+      interval: seconds between repository refreshes
+      watch_interval: seconds between checks of local directories
+    """
+    sources = load_sources(sources_file)
+    repo_sources = [source for source in sources if source.get("repo")]
+    watchers = [
+        (source, DirectoryWatcher(source["path"], source["filter"]))
+        for source in sources
+        if source.get("path")
+    ]
+    logger.info(
+        f"Daemon started: {len(repo_sources)} repositories, {len(watchers)} local directories"
+    )
+
+    handler = client.get_handler()
+    handler.get_user_session()
+    next_refresh = 0
+
+    try:
+        while True:
+            if time.monotonic() >= next_refresh:
+                next_refresh = time.monotonic() + interval
+                for source in repo_sources:
+                    try:
+                        refresh_repo(handler, source)
+                    except Exception as e:
+                        logger.error(f"Failed to refresh {source['repo']}: {e}")
+
+            for source, watcher in watchers:
+                files_knowledge, deleted = watcher.changes()
+                if not files_knowledge and not deleted:
+                    continue
+                logger.info(
+                    f"{len(files_knowledge)} files changed, {len(deleted)} deleted in {source['path']}"
+                )
+                try:
+                    lst_file_id = push(
+                        handler, source["collection_name"], files_knowledge
+                    )
+                    retire(
+                        handler, source["collection_name"], deleted, keep=lst_file_id
+                    )
+                except Exception as e:
+                    logger.error(f"Failed to push changes of {source['path']}: {e}")
+
+            time.sleep(watch_interval)
+    except KeyboardInterrupt:
+        logger.info("Daemon stopped")
+    finally:
+        for _, watcher in watchers:
+            watcher.stop()
+
+    return 0
+
+
+if __name__ == "__main__":
+    tmpx = None
@@ -1,12 +1,11 @@
 import os
 import shutil
 import subprocess
-from glob import glob
-from utils import settings
+from utils import settings, index
 from utils.base_logger import logger
 
 
-def collect_files(marker, filter, dir):
+def collect_files(marker, filter, dir, only=None):
     """
     Prepare the list of files to be added to Open WebUI as knowledge.
 
@@ -14,14 +13,27 @@ def collect_files(marker, filter, dir):
       marker: dictionary
       filter: list of file extensions to use as filter in comma-separated string provided in options.filter
       dir: directory inside the repository to start digging for files, provided in options.dir, defaults to "."
+      only: paths relative to the repository root to collect instead of walking dir, e.g. changed files from --delta
 
     Returns:
-      files_knowledge
+      files_knowledge: list of (path, size) tuples
     """
-    files_knowledge = []
+    return list(iter_files(marker, filter, dir, only))
 
+
+def iter_files(marker, filter, dir, only=None):
+    """
+    Same as collect_files, but yield the files one by one through the
+    walk -> filter -> convert -> size pipeline, so that the upload can start
+    with the first file and memory does not grow with the repository size.
+    The totals are logged once the pipeline is exhausted.
+
+    Returns:
+      generator of (path, size) tuples
+    """
     # repository path
-    dest = os.path.join(settings.base_knowledge_dir, marker.get("repo"))
+    repo_dest = os.path.join(settings.base_knowledge_dir, marker.get("repo"))
+    dest = repo_dest
     # concatenate options.dir
     if dir == ".":
         pass
@@ -33,49 +45,109 @@ def collect_files(marker, filter, dir):
         logger.info(f"Start collecting knowledges in {dest}")
     else:
         logger.error(f"Could not find the specified directory, {dest}. Exiting.")
-        raise
-
-    # get list of files to add to knowledge collection
-    all_files = glob(f"{dest}/**/*", recursive=True)
-
-    # filter
-    if filter != "ANY":
-        # filter for files with the specified extensions
-        collection_filters = [
-            ".{}".format(extension) for extension in filter.split(",")
-        ]
-        logger.debug(f"Collector will look for these extensions: {collection_filters}")
-        files_knowledge = [
-            file for file in all_files if file.endswith(tuple(collection_filters))
-        ]
+        raise FileNotFoundError(dest)
+
+    # get files to add to knowledge collection
+    if only is not None:
+        logger.debug(f"Collecting {len(only)} given files only")
+        files = (os.path.join(repo_dest, path) for path in only)
+        files = (file for file in files if os.path.isfile(file))
     else:
-        # exclude directories from everything picked up in all_files
-        files_knowledge = [file for file in all_files if not os.path.isdir(file)]
-
-    # log first and last three files in the list
-    file_count = len(files_knowledge)
-    logger.debug("List of files collected:")
-    for i, file in enumerate(files_knowledge):
-        if i < 3:
-            logger.debug(f"- {file}")
-            flag = True
-        elif i > file_count - 4:
-            logger.debug(f"- {file}")
-        else:
-            if flag:
-                flag = False
-                logger.debug("- ... omitting ...")
+        files = walk_files(dest)
+
+    files = filter_files(files, filter)
 
     # if pandoc is found on the host, convert rst files to markdown
     # as open webui is not accepting rst file as knowledge collection source
     if is_pandoc_installed():
-        files_knowledge = rst_workaround(files_knowledge)
+        files = rst_workaround(files)
+
+    return report_totals(
+        index.get_index().track_files(marker.get("repo"), size_files(files))
+    )
+
+
+def walk_files(dest):
+    """
+    Yield the files under dest, skipping hidden files and directories as glob does.
+    """
+    stack = [dest]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = sorted(os.scandir(current), key=lambda entry: entry.name)
+        except OSError as e:
+            logger.warning(f"Skipping {current}: {e}")
+            continue
+        subdirs = []
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir():
+                subdirs.append(entry.path)
+            elif entry.is_file():
+                yield entry.path
+        # keep directories in name order
+        stack.extend(reversed(subdirs))
+
+
+def filter_files(files, filter):
+    """
+    Yield the files with one of the extensions in filter, or all of them for "ANY".
+    """
+    if filter == "ANY":
+        yield from files
+        return
+
+    # filter for files with the specified extensions
+    collection_filters = tuple(
+        ".{}".format(extension) for extension in filter.split(",")
+    )
+    logger.debug(f"Collector will look for these extensions: {collection_filters}")
+    for file in files:
+        if file.endswith(collection_filters):
+            yield file
+
+
+def size_files(files):
+    """
+    Yield (path, size) tuples, the sizes are reused by the upload scheduler.
+    """
+    for file in files:
+        yield file, os.path.getsize(file)
+
+
+def report_totals(files):
+    """
+    Pass the files through and log the running totals at the end.
+    """
+    file_count = 0
+    total_size = 0
+    for file, size in files:
+        file_count += 1
+        total_size += size
+        logger.debug("Collected %s", file)
+        yield file, size
 
-    # total size of files
-    total_size = sum(os.path.getsize(file) for file in files_knowledge)
     logger.debug(f"Total knowledge collection size: {total_size:,}")
     logger.info(f"Collected {file_count} knowledge sources sizing {total_size:,} byte.")
 
+
+def collect_directory(path, filter):
+    """
+    Prepare the list of files in a local directory, such as a "path" source of --daemon.
+
+    Args:
+      path: local directory to dig for files
+      filter: list of file extensions to use as filter in comma-separated string, or "ANY"
+
+    Returns:
+      files_knowledge: list of (path, size) tuples
+    """
+    files = size_files(filter_files(walk_files(path), filter))
+    files_knowledge = list(index.get_index().track_files(None, files))
+    logger.info(f"Collected {len(files_knowledge)} knowledge sources in {path}")
+
     return files_knowledge
 
 
@@ -85,21 +157,19 @@ def is_pandoc_installed():
 
 def rst_workaround(files_knowledge):
     """
-    Process list of files and convert rst files to markdown.
+    Process files and convert rst files to markdown.
     This is a workaround until Open WebUI knowledge support rst format.
 
     Args:
-      files_knowledge: list of file path collected to be uploaded and added to knowledge collection
+      files_knowledge: iterable of file path collected to be uploaded and added to knowledge collection
 
     Returns:
-      files_knowledge: updated list of file path (only if there are rst files)
+      generator of file path, with rst files replaced by their markdown conversion
     """
-    new_files_knowledge = []
-
     for file in files_knowledge:
         if os.path.basename(file).endswith(".rst"):
             # convert the file to markdown using rst2md
-            # and add the new file path to the new list
+            # and pass the new file path on
             file_out = file.replace(".rst", ".md")
             try:
                 subprocess.run(
@@ -107,18 +177,18 @@ def rst_workaround(files_knowledge):
                     check=True,
                 )
                 logger.debug(
-                    f"{os.path.basename(file)} converted to markdown file: {file_out}"
+                    "%s converted to markdown file: %s",
+                    os.path.basename(file),
+                    file_out,
                 )
-                new_files_knowledge.append(file_out)
+                yield file_out
             except subprocess.CalledProcessError as e:
                 logger.error(f"Error during conversion: {e}")
                 logger.error(f"Standard Output: {e.stdout}")
                 logger.error(f"Standard Error: {e.stderr}")
         else:
             # put the file path back as-is if it's not rst file
-            new_files_knowledge.append(file)
-
-    return new_files_knowledge
+            yield file
 
 
 if __name__ == "__main__":
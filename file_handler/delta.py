@@ -0,0 +1,419 @@
+import os
+import json
+import shutil
+import subprocess
+import threading
+from utils import settings, index
+from utils.base_logger import logger
+
+
+def git_ref(marker):
+    """
+    Map the marker to the remote git reference to fetch.
+
+    Args:
+      marker: dictionary with keys "repo", "type", and "target"
+
+    Returns:
+      ref: fully qualified reference name
+    """
+    if marker.get("type") in ("tag", "release"):
+        return f"refs/tags/{marker.get('target')}"
+    return f"refs/heads/{marker.get('target')}"
+
+
+def run_git(args, cwd=None):
+    """
+    Run a git command and return its standard output.
+
+    Args:
+      args: list of arguments following "git"
+      cwd: directory to run the command in
+
+    Returns:
+      stdout: bytes
+    """
+    logger.debug(f"Running git {' '.join(args)}")
+    result = subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True)
+    return result.stdout
+
+
+def is_git_installed():
+    return shutil.which("git") is not None
+
+
+def update_mirror(marker):
+    """
+    Fetch the target reference into a local bare mirror of the repository.
+    The mirror is kept between runs, so later fetches only transfer new objects.
+
+    Args:
+      marker: dictionary with keys "repo", "type", and "target"
+
+    Returns:
+      mirror: path of the bare mirror
+      commit: commit SHA the reference points to
+    """
+    mirror = os.path.join(
+        settings.base_knowledge_dir, settings.mirror_dir, marker.get("repo")
+    )
+    remote_url = f"{settings.git_remote.rstrip('/')}/{marker.get('repo')}"
+
+    if not os.path.exists(mirror):
+        logger.info(f"Creating local mirror of {remote_url}")
+        os.makedirs(os.path.dirname(mirror), exist_ok=True)
+        # blobs are fetched on demand, only the ones actually needed are downloaded
+        run_git(
+            ["clone", "--bare", "--filter=blob:none", "--no-tags", remote_url, mirror]
+        )
+
+    refs = [git_ref(marker)]
+    if marker.get("type") == "main":
+        refs.append("refs/heads/master")
+
+    for ref in refs:
+        try:
+            run_git(["fetch", "--no-tags", "origin", f"+{ref}:{ref}"], cwd=mirror)
+            commit = run_git(["rev-parse", f"{ref}^{{commit}}"], cwd=mirror)
+            return mirror, commit.decode().strip()
+        except subprocess.CalledProcessError as e:
+            logger.debug(f"Failed to fetch {ref}: {e.stderr.decode().strip()}")
+
+    raise RuntimeError(f"Could not fetch {refs[0]} from {remote_url}")
+
+
+def load_state(marker, filter, dir):
+    """
+    Load the delta state of the knowledge source: last commit written to the
+    workspace, and changed/deleted files not yet handed to the uploader.
+
+    Args:
+      marker: dictionary with keys "repo", "type", and "target"
+      filter: comma-separated file extensions, or "ANY"
+      dir: directory inside the repository, or "."
+
+    Returns:
+      state: dictionary with keys "marker", "scope", "commit", "changed", and "deleted"
+    """
+    dir_workspace = os.path.join(settings.base_knowledge_dir, marker.get("repo"))
+    state_file = os.path.join(dir_workspace, settings.delta_state_file)
+    scope = {"filter": filter, "dir": dir}
+    state = {
+        "marker": marker,
+        "scope": scope,
+        "commit": None,
+        "changed": [],
+        "deleted": [],
+    }
+    if os.path.exists(state_file):
+        with open(state_file, "r") as entrada:
+            existing_state = json.load(entrada)
+        # a different ref or scope means the recorded commit does not describe
+        # the files of this scope in the workspace
+        if json.dumps(existing_state.get("marker")) == json.dumps(marker) and (
+            json.dumps(existing_state.get("scope")) == json.dumps(scope)
+        ):
+            state.update(existing_state)
+
+    return state
+
+
+def save_state(marker, state):
+    dir_workspace = os.path.join(settings.base_knowledge_dir, marker.get("repo"))
+    state_file = os.path.join(dir_workspace, settings.delta_state_file)
+    with open(state_file, "w") as salida:
+        salida.write(json.dumps(state))
+    logger.debug(f"Delta state written in {state_file}")
+
+    return 0
+
+
+def matches(path, filter, dir):
+    """
+    Tell if the repository path is under --dir and matches --filter.
+    """
+    if dir != "." and not path.startswith(dir.strip("/") + "/"):
+        return False
+    if filter == "ANY":
+        return True
+    return path.endswith(tuple(f".{extension}" for extension in filter.split(",")))
+
+
+def list_changes(mirror, old_commit, new_commit, filter, dir):
+    """
+    Compare two commits by blob SHA.
+
+    Args:
+      mirror: path of the bare mirror
+      old_commit: commit currently in the workspace, None to list the whole tree
+      new_commit: commit to update the workspace to
+      filter: comma-separated file extensions, or "ANY"
+      dir: directory inside the repository, or "."
+
+    Returns:
+      changed: list of (path, blob SHA) tuples to write
+      deleted: list of paths to remove
+    """
+    pathspec = [] if dir == "." else ["--", dir]
+    changed = []
+    deleted = []
+
+    if old_commit is None:
+        output = run_git(["ls-tree", "-r", "-z", new_commit, *pathspec], cwd=mirror)
+        for entry in output.split(b"\0"):
+            if not entry:
+                continue
+            info, path = entry.decode().split("\t", 1)
+            mode, obj_type, sha = info.split()
+            if obj_type == "blob" and mode != "120000" and matches(path, filter, dir):
+                changed.append((path, sha))
+        return changed, deleted
+
+    output = run_git(
+        ["diff-tree", "-r", "-z", "--no-renames", old_commit, new_commit, *pathspec],
+        cwd=mirror,
+    )
+    fields = output.split(b"\0")
+    # raw format: ":oldmode newmode oldsha newsha status" followed by the path
+    for info, path in zip(fields[0::2], fields[1::2]):
+        if not info:
+            continue
+        _, new_mode, _, new_sha, status = info.decode().lstrip(":").split()
+        path = path.decode()
+        if not matches(path, filter, dir):
+            continue
+        if status == "D" or new_mode in ("120000", "160000"):
+            deleted.append(path)
+        else:
+            changed.append((path, new_sha))
+
+    return changed, deleted
+
+
+def untracked_files(dest, filter, dir, tracked):
+    """
+    List the files of the scope in the workspace that are not in the tree.
+
+    Args:
+      dest: workspace directory of the repository
+      filter: comma-separated file extensions, or "ANY"
+      dir: directory inside the repository, or "."
+      tracked: set of repository paths in the tree
+
+    Returns:
+      paths: list of repository paths
+    """
+    paths = []
+    for root, dirs, files in os.walk(os.path.join(dest, dir)):
+        # skip the marker, the delta state, and preprocessed copies
+        dirs[:] = [name for name in dirs if not name.startswith(".")]
+        for name in files:
+            if name.startswith("."):
+                continue
+            path = os.path.relpath(os.path.join(root, name), dest)
+            path = path.replace(os.sep, "/")
+            if path not in tracked and matches(path, filter, dir):
+                paths.append(path)
+
+    return sorted(paths)
+
+
+def prefetch_blobs(mirror, commit, changed):
+    """
+    Fetch the blobs missing from the mirror in one request. Blobs of a
+    partial clone are otherwise fetched lazily, one round trip per blob.
+
+    Args:
+      mirror: path of the bare mirror
+      commit: commit holding the blobs
+      changed: list of (path, blob SHA) tuples
+    """
+    # list the objects of the commit without fetching the missing ones
+    output = run_git(
+        ["rev-list", "--objects", "--missing=print", "--no-walk", commit], cwd=mirror
+    )
+    missing = {line[1:] for line in output.decode().splitlines() if line[:1] == "?"}
+    wanted = sorted({sha for _, sha in changed if sha in missing})
+    if not wanted:
+        return 0
+
+    logger.info(f"Fetching {len(wanted)} missing blobs...")
+    # same request as git's own lazy fetch, with all the blobs at once
+    subprocess.run(
+        [
+            "git",
+            "-c",
+            "fetch.negotiationAlgorithm=noop",
+            "fetch",
+            "--no-tags",
+            "--no-write-fetch-head",
+            "--recurse-submodules=no",
+            "--filter=blob:none",
+            "--stdin",
+            "origin",
+        ],
+        cwd=mirror,
+        input="".join(f"{sha}\n" for sha in wanted).encode(),
+        check=True,
+        capture_output=True,
+    )
+
+    return 0
+
+
+def write_blobs(mirror, changed, dest):
+    """
+    Write blobs into the workspace using a single "git cat-file --batch" process.
+
+    Args:
+      mirror: path of the bare mirror
+      changed: list of (path, blob SHA) tuples
+      dest: workspace directory of the repository
+    """
+    process = subprocess.Popen(
+        ["git", "cat-file", "--batch"],
+        cwd=mirror,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+    )
+
+    def feed():
+        try:
+            for _, sha in changed:
+                process.stdin.write(f"{sha}\n".encode())
+            process.stdin.close()
+        except (BrokenPipeError, ValueError):
+            # the process was stopped before reading every request
+            pass
+
+    writer = threading.Thread(target=feed)
+    writer.start()
+
+    try:
+        for path, sha in changed:
+            header = process.stdout.readline().split()
+            if len(header) != 3 or header[1] != b"blob":
+                raise RuntimeError(f"Unexpected cat-file output for {path}: {header}")
+            size = int(header[2])
+            actual_dest = os.path.join(dest, path)
+            os.makedirs(os.path.dirname(actual_dest), exist_ok=True)
+            with open(actual_dest, "wb") as target:
+                remaining = size
+                while remaining > 0:
+                    chunk = process.stdout.read(min(remaining, 1024 * 1024))
+                    if not chunk:
+                        raise RuntimeError(f"Truncated cat-file output for {path}")
+                    target.write(chunk)
+                    remaining -= len(chunk)
+            process.stdout.read(1)  # trailing newline
+    except:
+        process.kill()
+        raise
+    finally:
+        # always reap the process and the feeder thread, even on failure
+        process.stdout.close()
+        returncode = process.wait()
+        writer.join()
+
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, ["git", "cat-file", "--batch"])
+
+    return 0
+
+
+def update_source(marker, filter, dir):
+    """
+    Update kb-source/<repo> in place with the files changed since the last update.
+
+    Args:
+      marker: dictionary with keys "repo", "type", and "target"
+      filter: comma-separated file extensions, or "ANY"
+      dir: directory inside the repository, or "."
+
+    Returns:
+      state: dictionary with the new commit and the changed/deleted paths pending upload
+    """
+    dest = os.path.join(settings.base_knowledge_dir, marker.get("repo"))
+    mirror, new_commit = update_mirror(marker)
+    state = load_state(marker, filter, dir)
+    old_commit = state.get("commit")
+    logger.debug(f"Workspace commit: {old_commit}, remote commit: {new_commit}")
+
+    if old_commit == new_commit:
+        logger.info("The knowledge source is already up to date")
+        return state
+
+    changed, deleted = list_changes(mirror, old_commit, new_commit, filter, dir)
+    # the workspace may hold files of this scope from a zip extraction or
+    # another ref, the first update removes the ones missing from the tree
+    if old_commit is None:
+        deleted = untracked_files(dest, filter, dir, {path for path, _ in changed})
+
+    logger.info(f"Files changed: {len(changed)}, files deleted: {len(deleted)}")
+
+    prefetch_blobs(mirror, new_commit, changed)
+    write_blobs(mirror, changed, dest)
+    for path in deleted:
+        actual_dest = os.path.join(dest, path)
+        if os.path.exists(actual_dest):
+            os.remove(actual_dest)
+            logger.debug(f"Removed {actual_dest}")
+
+    # merge with files not yet uploaded since the previous update
+    changed_paths = [path for path, _ in changed]
+    pending = set(state.get("changed")) - set(deleted)
+    state["changed"] = sorted(pending.union(changed_paths))
+    # a path deleted earlier and added back is pending upload, not removal
+    pending_deleted = set(state.get("deleted")) - set(changed_paths)
+    state["deleted"] = sorted(pending_deleted.union(deleted))
+    state["commit"] = new_commit
+    save_state(marker, state)
+    index.get_index().record_source(marker, new_commit)
+
+    # only the files of this scope follow the new commit, so the workspace no
+    # longer matches a full zip extraction: the delta state file is its marker
+    marker_file = os.path.join(dest, settings.marker_file)
+    if os.path.exists(marker_file):
+        os.remove(marker_file)
+        logger.debug(f"Removed {marker_file}, superseded by the delta state")
+
+    return state
+
+
+def is_current(marker, filter, dir):
+    """
+    Tell if the files of this scope were written by a delta update of this marker.
+
+    Args:
+      marker: dictionary with keys "repo", "type", and "target"
+      filter: comma-separated file extensions, or "ANY"
+      dir: directory inside the repository, or "."
+
+    Returns:
+      boolean
+    """
+    return load_state(marker, filter, dir).get("commit") is not None
+
+
+def workspace_paths(marker, paths):
+    """
+    Local paths of repository paths, as collected from kb-source/<repo>.
+    """
+    dest = os.path.join(settings.base_knowledge_dir, marker.get("repo"))
+    return [os.path.join(dest, path) for path in paths or []]
+
+
+def clear_pending(marker, filter, dir):
+    """
+    Forget the changed/deleted files once they have been handed to the uploader.
+    """
+    state = load_state(marker, filter, dir)
+    state["changed"] = []
+    state["deleted"] = []
+    save_state(marker, state)
+
+    return 0
+
+
+if __name__ == "__main__":
+    tmpx = None
@@ -1,7 +1,6 @@
 import os
 import json
 from utils import settings
-import requests
 from utils.base_logger import logger
 
 
@@ -103,6 +102,9 @@ def download_file(url):
 
     Returns:
     """
+    # requests is only needed here, keep it out of the module import
+    import requests
+
     zip_file_path = os.path.join(settings.base_knowledge_dir, "data.zip")
 
     try:
@@ -2,7 +2,7 @@ import os
 import zipfile
 import json
 import shutil
-from utils import settings
+from utils import settings, progress, index
 from utils.base_logger import logger
 
 
@@ -49,7 +49,13 @@ def extract_zip(zip_file_path, marker):
         # start processing
         if dir_prefix:
             with zipfile.ZipFile(zip_file_path, "r") as zip_ref:
-                for file_info in zip_ref.infolist():
+                members = zip_ref.infolist()
+                reporter = progress.ProgressReporter(
+                    "Files extracted",
+                    total=sum(1 for member in members if not member.is_dir()),
+                    total_bytes=sum(member.file_size for member in members),
+                )
+                for file_info in members:
                     fname = file_info.filename
                     if fname.endswith("/"):
                         dir_name = file_info.filename
@@ -58,19 +64,21 @@ def extract_zip(zip_file_path, marker):
                         actual_dir = os.path.join(
                             dest, dir_name.removeprefix(dir_prefix)
                         )
-                        logger.debug(f"Creating directory {actual_dir}")
+                        logger.debug("Creating directory %s", actual_dir)
                         os.makedirs(os.path.dirname(actual_dir), exist_ok=True)
                     else:
                         filename = file_info.filename
                         actual_dest = os.path.join(
                             dest, filename.removeprefix(dir_prefix)
                         )
-                        logger.debug(f"Extracting file {actual_dest}")
+                        logger.debug("Extracting file %s", actual_dest)
                         with (
                             zip_ref.open(file_info) as source,
                             open(actual_dest, "wb") as target,
                         ):
                             target.write(source.read())
+                        reporter.update(nbytes=file_info.file_size)
+                reporter.finish()
         else:
             try:
                 zip_ref.extractall(dest)
@@ -82,6 +90,8 @@ def extract_zip(zip_file_path, marker):
                 logger.error(f"Error extracting zip file: {e}")
                 return None
 
+        index.get_index().record_source(marker)
+
         return 0
 
     except FileNotFoundError:
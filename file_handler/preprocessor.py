@@ -0,0 +1,183 @@
+import os
+import re
+from utils import settings, index
+from utils.base_logger import logger
+
+# text formats that are safe to clean up and split
+TEXT_EXTENSIONS = (".md", ".markdown", ".txt")
+
+FRONT_MATTER = re.compile(r"\A(?:---|\+\+\+)\n.*?\n(?:---|\+\+\+)\n", re.DOTALL)
+# lines holding nothing but badge images, e.g. [![build](https://img.shields.io/...)](...)
+BADGE_LINE = re.compile(
+    r"^\s*(?:\[?!\[[^\]]*\]\([^)]*(?:badge|shields\.io)[^)]*\)(?:\]\([^)]*\))?\s*)+$",
+    re.IGNORECASE | re.MULTILINE,
+)
+TRAILING_SPACES = re.compile(r"[ \t]+$", re.MULTILINE)
+BLANK_LINES = re.compile(r"\n{3,}")
+HEADING = re.compile(r"^(?=#{1,6} )", re.MULTILINE)
+# numbered part suffix of a split document, before its extension
+PART_SUFFIX = re.compile(r"\.part\d{3}(\.[^./\\]*)?$")
+
+
+def processed_path(file):
+    """
+    Path under kb-source/.processed mirroring the original file path.
+    """
+    base = os.path.abspath(settings.base_knowledge_dir)
+    path = os.path.abspath(file)
+    if path.startswith(base + os.sep):
+        relative = os.path.relpath(path, base)
+    else:
+        relative = os.path.splitdrive(path)[1].lstrip(os.sep)
+
+    return os.path.join(settings.base_knowledge_dir, settings.preprocess_dir, relative)
+
+
+def uploaded_path(file):
+    """
+    Path of the copy uploaded for a source file, its processed path with --preprocess.
+    """
+    if settings.preprocess and file.lower().endswith(TEXT_EXTENSIONS):
+        return processed_path(file)
+    return file
+
+
+def part_origin(path):
+    """
+    Processed path a part was split from, or the path itself when it is not a part.
+    """
+    processed_dir = os.path.join(settings.base_knowledge_dir, settings.preprocess_dir)
+    if path.startswith(processed_dir + os.sep):
+        return PART_SUFFIX.sub(r"\1", path)
+    return path
+
+
+def clean_text(text):
+    """
+    Strip front matter and badge lines, and normalise whitespace.
+    """
+    text = text.replace("\r\n", "\n")
+    text = FRONT_MATTER.sub("", text)
+    text = BADGE_LINE.sub("", text)
+    text = TRAILING_SPACES.sub("", text)
+    text = BLANK_LINES.sub("\n\n", text)
+
+    return text.strip() + "\n"
+
+
+def split_text(text, max_size):
+    """
+    Split text into parts of at most max_size bytes, cutting at headings first,
+    then at paragraphs, then at lines. A single line longer than max_size is
+    kept whole.
+
+    Args:
+      text: document text
+      max_size: maximum size of a part in byte
+
+    Returns:
+      parts: list of strings
+    """
+    if len(text.encode()) <= max_size:
+        return [text]
+
+    parts = []
+    current = ""
+
+    def add(block):
+        nonlocal current
+        if len((current + block).encode()) <= max_size:
+            current += block
+            return
+        if current:
+            parts.append(current)
+            current = ""
+        if len(block.encode()) <= max_size:
+            current = block
+            return
+        # the block alone is too large, split it further
+        for separator in ("\n\n", "\n"):
+            pieces = [piece + separator for piece in block.split(separator)]
+            pieces[-1] = pieces[-1].removesuffix(separator)
+            pieces = [piece for piece in pieces if piece]
+            if len(pieces) > 1:
+                for piece in pieces:
+                    add(piece)
+                return
+        parts.append(block)
+
+    for block in HEADING.split(text):
+        if block:
+            add(block)
+    if current:
+        parts.append(current)
+
+    return parts
+
+
+def preprocess_files(files_knowledge, max_size=None):
+    """
+    Clean up text documents and split large ones into numbered parts.
+
+    Parts are written under kb-source/.processed as <name>.partNNN<ext>, so the
+    same source always produces the same file names. Other files are passed
+    through untouched. Files are processed one by one as they are consumed.
+
+    The outputs are recorded in the local index like collected files, so that
+    --skip_existing and --reconcile compare the content actually uploaded.
+
+    Args:
+      files_knowledge: iterable of (path, size) tuples from collect_files or iter_files
+      max_size: maximum size of a part in byte, defaults to settings.preprocess_max_part_size
+
+    Returns:
+      generator of (path, size) tuples to upload
+    """
+    if max_size is None:
+        max_size = settings.preprocess_max_part_size
+
+    return index.get_index().track_files(None, split_files(files_knowledge, max_size))
+
+
+def split_files(files_knowledge, max_size):
+    """
+    Generator behind preprocess_files, writing the parts of each file.
+    """
+
+    count_in = 0
+    count_out = 0
+    bytes_in = 0
+    bytes_out = 0
+    for file, size in files_knowledge:
+        count_in += 1
+        if not file.lower().endswith(TEXT_EXTENSIONS):
+            count_out += 1
+            yield file, size
+            continue
+
+        with open(file, "r", encoding="utf-8", errors="replace") as entrada:
+            text = clean_text(entrada.read())
+        parts = split_text(text, max_size)
+
+        dest = processed_path(file)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        stem, ext = os.path.splitext(dest)
+        bytes_in += size
+        if len(parts) > 1:
+            logger.debug("%s split into %d parts", file, len(parts))
+        for i, part in enumerate(parts):
+            part_file = dest if len(parts) == 1 else f"{stem}.part{i + 1:03d}{ext}"
+            with open(part_file, "w", encoding="utf-8") as salida:
+                salida.write(part)
+            part_size = os.path.getsize(part_file)
+            count_out += 1
+            bytes_out += part_size
+            yield part_file, part_size
+
+    logger.info(
+        f"Preprocessed {count_in} files into {count_out}, text reduced from {bytes_in:,} to {bytes_out:,} byte"
+    )
+
+
+if __name__ == "__main__":
+    tmpx = None
@@ -0,0 +1,115 @@
+import os
+import threading
+from file_handler.delta import matches
+from utils.base_logger import logger
+
+# watchdog events telling that a file may have changed or vanished,
+# "opened" and "closed_no_write" come from reads, uploads included
+CONTENT_EVENTS = ("created", "modified", "moved", "closed", "deleted")
+
+
+def is_watchdog_installed():
+    try:
+        import watchdog  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class DirectoryWatcher:
+    """
+    Track files created, modified, or deleted in a local knowledge directory.
+
+    Filesystem notifications are used when the optional watchdog package is
+    installed; otherwise the directory is rescanned and compared by mtime and
+    size on each call to changes().
+    """
+
+    def __init__(self, path, filter="ANY"):
+        self.path = path
+        self.filter = filter
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.observer = None
+        self.snapshot = {}
+
+        if is_watchdog_installed():
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+
+            watcher = self
+
+            class Handler(FileSystemEventHandler):
+                def on_any_event(self, event):
+                    if event.is_directory or event.event_type not in CONTENT_EVENTS:
+                        return
+                    with watcher.lock:
+                        # a moved file is deleted from its source path
+                        watcher.pending.add(event.src_path)
+                        if getattr(event, "dest_path", None):
+                            watcher.pending.add(event.dest_path)
+
+            self.observer = Observer()
+            self.observer.schedule(Handler(), path, recursive=True)
+            self.observer.start()
+            logger.debug(f"Watching {path} with filesystem notifications")
+        else:
+            self.snapshot = self.scan()
+            logger.debug(f"Watching {path} by polling, {len(self.snapshot)} files")
+
+    def scan(self):
+        snapshot = {}
+        for root, _, filenames in os.walk(self.path):
+            for filename in filenames:
+                file = os.path.join(root, filename)
+                try:
+                    stat = os.stat(file)
+                except OSError:
+                    continue
+                snapshot[file] = (stat.st_mtime_ns, stat.st_size)
+
+        return snapshot
+
+    def changes(self):
+        """
+        Return the files created, modified, or deleted since the previous call.
+
+        Returns:
+          files: list of (path, size) tuples matching the filter, as collect_files does
+          deleted: list of the paths matching the filter that no longer exist
+        """
+        if self.observer is not None:
+            with self.lock:
+                paths, self.pending = self.pending, set()
+        else:
+            snapshot = self.scan()
+            paths = [
+                file
+                for file, stat in snapshot.items()
+                if self.snapshot.get(file) != stat
+            ]
+            paths.extend(file for file in self.snapshot if file not in snapshot)
+            self.snapshot = snapshot
+
+        files = []
+        deleted = []
+        for file in sorted(paths):
+            if not matches(os.path.relpath(file, self.path), self.filter, "."):
+                continue
+            if os.path.isfile(file):
+                files.append((file, os.path.getsize(file)))
+            elif not os.path.exists(file):
+                deleted.append(file)
+
+        return files, deleted
+
+    def stop(self):
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+
+        return 0
+
+
+if __name__ == "__main__":
+    tmpx = None
@@ -0,0 +1,265 @@
+"""Open WebUI Knowledge Manager reconciliation
+
+Compare knowledge collections with their local sources, and bring them in
+line: remove entries whose content is no longer found locally, remove
+duplicate contents, and add local files missing from the collection.
+"""
+
+# general imports
+import os
+from argparse import Namespace
+from concurrent.futures import ThreadPoolExecutor
+
+# module imports
+from utils import settings, index
+from utils.base_logger import logger
+
+from file_handler import downloader, collector, delta, preprocessor
+
+from daemon import load_sources
+
+
+def collect_source(source):
+    """
+    Collect the local files of a source, as uploaded by --upload or --daemon.
+
+    Returns:
+      files_knowledge: list of (path, size) tuples, None when the source is not available locally
+    """
+    if source.get("path"):
+        files_knowledge = collector.collect_directory(source["path"], source["filter"])
+    else:
+        _, marker = downloader.generate_url(Namespace(**source))
+        # either a full zip extraction, or a delta update of this scope
+        if not (
+            downloader.compare_marker(marker)
+            or delta.is_current(marker, source["filter"], source["dir"])
+        ):
+            logger.error(f"{source['repo']} needs to be downloaded first, skipping")
+            return None
+        files_knowledge = collector.collect_files(
+            marker, source["filter"], source["dir"]
+        )
+
+    # the uploaded copies are the preprocessed parts
+    if settings.preprocess:
+        files_knowledge = list(preprocessor.preprocess_files(files_knowledge))
+
+    return files_knowledge
+
+
+def plan_collection(collection, files_knowledge, sha256_by_path, sha256_by_file_id):
+    """
+    Compute the changes bringing a collection in line with its local files.
+    Contents are compared by SHA-256 from the local index. Entries whose file
+    ID is not in the index, e.g. uploaded before the index existed, are matched
+    to local files by name and size instead; the ones matching no local file
+    are left as-is.
+
+    Returns:
+      plan: dictionary with keys "id", "name", "remove", "dedup", "add",
+        "matched", and "unmanaged"
+    """
+    wanted = {}
+    # local contents by file name and size, for entries missing from the index
+    by_name = {}
+    for path, size in files_knowledge:
+        sha256 = sha256_by_path.get(path)
+        if sha256 is not None:
+            wanted.setdefault(sha256, (path, size))
+            by_name.setdefault((os.path.basename(path), size), []).append(sha256)
+
+    plan = {
+        "id": collection.get("id"),
+        "name": collection.get("name"),
+        "remove": [],
+        "dedup": [],
+        "add": [],
+        "matched": 0,
+        "unmanaged": 0,
+    }
+    present = set()
+    for file in collection.get("files") or []:
+        file_id = file.get("id")
+        sha256 = sha256_by_file_id.get(file_id)
+        if sha256 is None:
+            meta = file.get("meta") or {}
+            key = (meta.get("name") or file.get("filename"), meta.get("size"))
+            if key not in by_name:
+                plan["unmanaged"] += 1
+                continue
+            plan["matched"] += 1
+            # each local file stands for one entry, further ones are duplicates
+            candidates = by_name[key]
+            if not candidates:
+                plan["dedup"].append(file_id)
+                continue
+            sha256 = candidates.pop()
+        if sha256 in present:
+            plan["dedup"].append(file_id)
+        elif sha256 not in wanted:
+            plan["remove"].append(file_id)
+            present.add(sha256)
+        else:
+            present.add(sha256)
+    plan["add"] = [file for sha256, file in wanted.items() if sha256 not in present]
+
+    return plan
+
+
+def remove_stale(handler, plan):
+    stale = plan["remove"] + plan["dedup"]
+    if stale:
+        handler.remove_files_from_knowledge(stale, plan["id"])
+
+    return 0
+
+
+def add_missing(handler, plan, file_ids):
+    lst_file_id = [file_ids[path] for path, _ in plan["add"] if path in file_ids]
+    if lst_file_id:
+        handler.add_files_to_knowledge(lst_file_id, id_knowledge=plan["id"])
+
+    return 0
+
+
+def attempt(func, handler, plan, *args):
+    """
+    Apply one step of the plan of one collection. Errors are returned, not
+    raised, so that one failing collection does not stop the others.
+
+    Returns:
+      error: None on success, or the exception raised
+    """
+    try:
+        func(handler, plan, *args)
+    except Exception as e:
+        logger.error(f"Failed to reconcile collection {plan['name']}: {e}")
+        return e
+
+    return None
+
+
+def apply_plans(handler, plans):
+    """
+    Apply the plans: removals and additions run with one worker per
+    collection, while the uploads of every collection go through a single
+    upload scheduler, so the upload budgets hold for the whole run.
+
+    Returns:
+      errors: dictionary of collection ID to the exception raised
+    """
+    errors = {}
+    with ThreadPoolExecutor(max_workers=settings.reconcile_workers) as executor:
+        removing = [plan for plan in plans if plan["remove"] or plan["dedup"]]
+        for plan, error in zip(
+            removing,
+            executor.map(lambda plan: attempt(remove_stale, handler, plan), removing),
+        ):
+            if error is not None:
+                errors[plan["id"]] = error
+
+        adding = [plan for plan in plans if plan["add"] and plan["id"] not in errors]
+        # a file wanted by several collections is uploaded once
+        files = {path: size for plan in adding for path, size in plan["add"]}
+        file_ids = {}
+        try:
+            if files:
+                file_ids = handler.upload_files_by_path(list(files.items()))
+        except Exception as e:
+            logger.error(
+                f"Failed to upload the files missing from the collections: {e}"
+            )
+            errors.update((plan["id"], e) for plan in adding)
+            adding = []
+
+        for plan, error in zip(
+            adding,
+            executor.map(
+                lambda plan: attempt(add_missing, handler, plan, file_ids), adding
+            ),
+        ):
+            if error is not None:
+                errors[plan["id"]] = error
+
+    return errors
+
+
+def run(handler, sources_file, dry_run=False):
+    """
+    Reconcile every collection listed in the sources file in one pass.
+
+    Args:
+      handler: OWUIHandler
+      sources_file: JSON file of sources, see daemon.load_sources
+      dry_run: only log the plan
+
+    Returns:
+      plans: list of plans, see plan_collection
+    """
+    # several sources may feed the same collection
+    sources = {}
+    for source in load_sources(sources_file):
+        sources.setdefault(source["collection_name"], []).append(source)
+    collections = handler.get_knowledge_collections(refresh=True)
+
+    # a collection listed in sources but missing remotely is created empty
+    existing = {col.get("name") for col in collections}
+    for name in sources:
+        if name not in existing:
+            handler.create_knowledge_collection(name)
+            collections = handler.get_knowledge_collections()
+
+    # collect every source first, so that the index holds all local hashes
+    # a collection is planned against the files of all its sources together
+    targets = []
+    for collection in collections:
+        collection_sources = sources.get(collection.get("name"))
+        if collection_sources is None:
+            logger.debug("No local source for collection %s", collection.get("name"))
+            continue
+        files_knowledge = []
+        for source in collection_sources:
+            source_files = collect_source(source)
+            if source_files is None:
+                # planning without these files would remove their entries
+                logger.error(
+                    f"Skipping collection {collection.get('name')}, one of its sources is not available locally"
+                )
+                files_knowledge = None
+                break
+            files_knowledge.extend(source_files)
+        if files_knowledge is not None:
+            targets.append((collection, files_knowledge))
+
+    local_index = index.get_index()
+    sha256_by_path = local_index.sha256_by_path()
+    sha256_by_file_id = local_index.sha256_by_file_id()
+    plans = [
+        plan_collection(collection, files_knowledge, sha256_by_path, sha256_by_file_id)
+        for collection, files_knowledge in targets
+    ]
+
+    for plan in plans:
+        logger.info(
+            f"Collection {plan['name']}: remove {len(plan['remove'])}, dedup {len(plan['dedup'])}, add {len(plan['add'])}, matched by name {plan['matched']}, unmanaged {plan['unmanaged']}"
+        )
+
+    if dry_run:
+        return plans
+
+    pending = [plan for plan in plans if plan["remove"] or plan["dedup"] or plan["add"]]
+    errors = apply_plans(handler, pending)
+
+    failed = [plan["name"] for plan in pending if plan["id"] in errors]
+    logger.info(
+        f"Reconciled {len(pending) - len(failed)} of {len(pending)} collections needing changes"
+    )
+    if failed:
+        logger.error(f"Collections failed to reconcile: {failed}")
+
+    return plans
+
+
+if __name__ == "__main__":
+    tmpx = None
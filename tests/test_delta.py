@@ -0,0 +1,111 @@
+"""Delta download against a local git repository, without network access."""
+
+# general imports
+import os
+import shutil
+import tempfile
+import subprocess
+import unittest
+
+# module imports
+from utils import settings, index
+from file_handler import delta, downloader
+
+
+def git(*args, cwd=None):
+    subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        cwd=cwd,
+        check=True,
+        capture_output=True,
+    )
+
+
+@unittest.skipUnless(delta.is_git_installed(), "git is required")
+class UpdateSourceTest(unittest.TestCase):
+    marker = {"repo": "acme/docs", "type": "main", "target": "main"}
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        settings.init()
+        settings.base_knowledge_dir = os.path.join(self.tmp, "kb-source")
+        settings.git_remote = os.path.join(self.tmp, "remote")
+        index._local.index = None
+
+        # bare repository served as <git_remote>/<repo>, and a clone to commit from
+        self.remote = os.path.join(settings.git_remote, "acme", "docs")
+        self.work = os.path.join(self.tmp, "work")
+        git("init", "-q", "--bare", "-b", "main", self.remote)
+        git("clone", "-q", self.remote, self.work)
+        git("checkout", "-q", "-b", "main", cwd=self.work)
+        downloader.prepare_directory(self.marker)
+
+    def tearDown(self):
+        index._local.index.conn.close()
+        index._local.index = None
+        shutil.rmtree(self.tmp)
+
+    def commit(self, files, removed=()):
+        for path, text in files.items():
+            file = os.path.join(self.work, path)
+            os.makedirs(os.path.dirname(file), exist_ok=True)
+            with open(file, "w") as salida:
+                salida.write(text)
+        for path in removed:
+            git("rm", "-q", path, cwd=self.work)
+        git("add", "-A", cwd=self.work)
+        git("commit", "-q", "-m", "update", cwd=self.work)
+        git("push", "-q", "origin", "main", cwd=self.work)
+
+    def update(self):
+        return delta.update_source(self.marker, "md", "content")
+
+    def workspace(self):
+        dest = os.path.join(settings.base_knowledge_dir, "acme", "docs", "content")
+        contents = {}
+        for name in sorted(os.listdir(dest)):
+            with open(os.path.join(dest, name)) as entrada:
+                contents[name] = entrada.read()
+        return contents
+
+    def test_add_modify_delete_readd(self):
+        # add: only the files of the scope are written
+        self.commit(
+            {
+                "content/a.md": "a1\n",
+                "content/b.md": "b1\n",
+                "content/x.txt": "x\n",
+                "readme.md": "r\n",
+            }
+        )
+        state = self.update()
+        self.assertEqual(self.workspace(), {"a.md": "a1\n", "b.md": "b1\n"})
+        self.assertEqual(state["changed"], ["content/a.md", "content/b.md"])
+        self.assertEqual(state["deleted"], [])
+        self.assertTrue(delta.is_current(self.marker, "md", "content"))
+        self.assertFalse(downloader.compare_marker(self.marker))
+        delta.clear_pending(self.marker, "md", "content")
+
+        # modify and delete
+        self.commit({"content/a.md": "a2\n"}, removed=["content/b.md"])
+        state = self.update()
+        self.assertEqual(self.workspace(), {"a.md": "a2\n"})
+        self.assertEqual(state["changed"], ["content/a.md"])
+        self.assertEqual(state["deleted"], ["content/b.md"])
+
+        # re-add before the pending changes are uploaded
+        self.commit({"content/b.md": "b2\n"})
+        state = self.update()
+        self.assertEqual(self.workspace(), {"a.md": "a2\n", "b.md": "b2\n"})
+        self.assertEqual(state["changed"], ["content/a.md", "content/b.md"])
+        self.assertEqual(state["deleted"], [])
+
+        # nothing new upstream
+        commit = state["commit"]
+        state = self.update()
+        self.assertEqual(state["commit"], commit)
+        self.assertEqual(delta.load_state(self.marker, "md", "content"), state)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -47,6 +47,21 @@ def parse_options():
         action="store_true",
         help="Clean up uploaded files not linked to knowledges on Open WebUI.",
     )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Keep running and push changes of the sources listed in --sources.",
+    )
+    parser.add_argument(
+        "--reconcile",
+        action="store_true",
+        help="Bring the collections listed in --sources in line with their local files. Use with --prepare to only show the plan.",
+    )
+    parser.add_argument(
+        "--index_report",
+        action="store_true",
+        help="Report counts of the local index: sources, files, uploads, orphans, and duplicates.",
+    )
     parser.add_argument(
         "--prepare",
         action="store_true",
@@ -77,10 +92,104 @@ def parse_options():
         help="List of comma-separated file suffixes to use to filter.",
     )
 
+    parser.add_argument(
+        "--delta",
+        action="store_true",
+        help="Download and upload only the files changed since the last --delta download, using a local git mirror.",
+    )
+    parser.add_argument(
+        "--git_remote",
+        help="Base URL or local path of the git repositories used by --delta, defaults to https://github.com.",
+    )
+
+    # arguments on --daemon
+    parser.add_argument(
+        "--sources", help="JSON file listing the knowledge sources for --daemon."
+    )
+    parser.add_argument(
+        "--interval",
+        type=int,
+        help="Seconds between repository refreshes in --daemon, defaults to 300.",
+    )
+    parser.add_argument(
+        "--watch_interval",
+        type=int,
+        help="Seconds between local directory checks in --daemon, defaults to 10.",
+    )
+
     # arguments on knowledge collection
     parser.add_argument("--knowledge_name", help="Name of the knowledge.")
     parser.add_argument("--collection_name", help="Name of the collection.")
 
+    # arguments on upload scheduling
+    parser.add_argument(
+        "--upload_workers",
+        type=int,
+        help="Maximum number of file uploads in flight.",
+    )
+    parser.add_argument(
+        "--max_inflight_bytes",
+        type=int,
+        help="Maximum total size in byte of the file uploads in flight, 0 for no limit.",
+    )
+    parser.add_argument(
+        "--max_file_size",
+        type=int,
+        help="Skip files larger than this size in byte, 0 for no limit.",
+    )
+
+    parser.add_argument(
+        "--skip_existing",
+        action="store_true",
+        help="Skip files whose identical content is already in the collection, according to the local index.",
+    )
+    parser.add_argument(
+        "--preprocess",
+        action="store_true",
+        help="Strip front matter and badges from text documents and split large ones before upload.",
+    )
+    parser.add_argument(
+        "--max_part_size",
+        type=int,
+        help="Maximum size in byte of the parts made by --preprocess, defaults to 102400.",
+    )
+    parser.add_argument(
+        "--compress",
+        action="store_true",
+        help="Send upload requests gzip-encoded, falling back to plain requests if refused.",
+    )
+
+    # arguments on --list output
+    parser.add_argument(
+        "--output",
+        choices=["text", "json", "csv"],
+        default="text",
+        help="Output format of --list.",
+    )
+    parser.add_argument(
+        "--sort_by",
+        choices=["name", "files", "size", "newest"],
+        default=None,
+        help="Sort key of --list, the order of the API when not given.",
+    )
+    parser.add_argument(
+        "--reverse", action="store_true", help="Sort --list in descending order."
+    )
+    parser.add_argument(
+        "--match", help="Only list collections whose name contains this string."
+    )
+
+    # arguments on remote state cache
+    parser.add_argument(
+        "--cache_ttl",
+        type=int,
+        help="Seconds to reuse fetched collection and file listings, 0 to disable.",
+    )
+    parser.add_argument(
+        "--cache_file",
+        help="JSON snapshot file to share the remote state cache across runs.",
+    )
+
     if len(sys.argv) > 1:
         args, unknown = parser.parse_known_args()
         return args, unknown
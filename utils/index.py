@@ -0,0 +1,314 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from utils import settings
+from utils.base_logger import logger
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    repo TEXT PRIMARY KEY,
+    type TEXT,
+    target TEXT,
+    commit_sha TEXT,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    repo TEXT,
+    size INTEGER,
+    mtime_ns INTEGER,
+    sha256 TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS files_repo ON files (repo);
+CREATE INDEX IF NOT EXISTS files_sha256 ON files (sha256);
+CREATE TABLE IF NOT EXISTS remote_files (
+    file_id TEXT PRIMARY KEY,
+    path TEXT,
+    sha256 TEXT,
+    size INTEGER,
+    uploaded_at REAL
+);
+CREATE INDEX IF NOT EXISTS remote_files_path ON remote_files (path);
+CREATE INDEX IF NOT EXISTS remote_files_sha256 ON remote_files (sha256);
+CREATE TABLE IF NOT EXISTS collections (
+    collection_id TEXT PRIMARY KEY,
+    name TEXT
+);
+CREATE TABLE IF NOT EXISTS memberships (
+    collection_id TEXT,
+    file_id TEXT,
+    PRIMARY KEY (collection_id, file_id)
+);
+CREATE INDEX IF NOT EXISTS memberships_file_id ON memberships (file_id);
+"""
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as entrada:
+        for chunk in iter(lambda: entrada.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class LocalIndex:
+    """
+    SQLite index of knowledge sources, local files, and their Open WebUI copies.
+
+    - sources: repository, ref, and commit of each downloaded knowledge source
+    - files: local path, size, mtime, and SHA-256 of collected files
+    - remote_files: Open WebUI file ID of each uploaded local file
+    - collections, memberships: which file IDs each knowledge collection holds
+    """
+
+    def __init__(self, index_file):
+        self.index_file = index_file
+        os.makedirs(os.path.dirname(index_file) or ".", exist_ok=True)
+        # wait for other threads or processes writing to the same index
+        self.conn = sqlite3.connect(index_file, timeout=30)
+        # readers are not blocked by a writer, and commits do not wait on fsync,
+        # so that each collected file can be committed on its own
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        logger.debug(f"Local index opened at {index_file}")
+
+    def record_source(self, marker, commit=None):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?)",
+                (
+                    marker.get("repo"),
+                    marker.get("type"),
+                    marker.get("target"),
+                    commit,
+                    time.time(),
+                ),
+            )
+
+        return 0
+
+    def track_files(self, repo, files_knowledge, on_changed=None):
+        """
+        Record files while passing them through, for streaming pipelines.
+        Each new or modified row is committed before its file is passed on, so
+        no transaction stays open while the consumer uploads the file.
+
+        Args:
+          repo: repository the files belong to, None for local directories
+          files_knowledge: iterable of (path, size) tuples
+          on_changed: optional callable taking each new or modified (path, size) tuple
+
+        Returns:
+          generator of (path, size) tuples
+        """
+        file_count = 0
+        changed_count = 0
+        now = time.time()
+        for path, size in files_knowledge:
+            file_count += 1
+            mtime_ns = os.stat(path).st_mtime_ns
+            row = self.conn.execute(
+                "SELECT size, mtime_ns FROM files WHERE path = ?", (path,)
+            ).fetchone()
+            if row is None or tuple(row) != (size, mtime_ns):
+                changed_count += 1
+                sha256 = file_sha256(path)
+                with self.conn:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                        (path, repo, size, mtime_ns, sha256, now),
+                    )
+                if on_changed is not None:
+                    on_changed((path, size))
+            yield path, size
+
+        logger.info(
+            f"{changed_count} of {file_count} collected files are new or modified since the last collection"
+        )
+
+    def record_upload(self, path, file_id, size):
+        row = self.conn.execute(
+            "SELECT sha256 FROM files WHERE path = ?", (path,)
+        ).fetchone()
+        sha256 = row[0] if row else file_sha256(path)
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO remote_files VALUES (?, ?, ?, ?, ?)",
+                (file_id, path, sha256, size, time.time()),
+            )
+
+        return 0
+
+    def record_collection(self, collection_id, name):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO collections VALUES (?, ?)",
+                (collection_id, name),
+            )
+
+        return 0
+
+    def record_memberships(self, collection_id, file_ids):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO memberships VALUES (?, ?)",
+                [(collection_id, file_id) for file_id in file_ids],
+            )
+
+        return 0
+
+    def sync_collections(self, collections):
+        """
+        Replace collections and memberships with a listing fetched from Open WebUI.
+        """
+        with self.conn:
+            self.conn.execute("DELETE FROM collections")
+            self.conn.execute("DELETE FROM memberships")
+            for col in collections:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO collections VALUES (?, ?)",
+                    (col.get("id"), col.get("name")),
+                )
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO memberships VALUES (?, ?)",
+                    [
+                        (col.get("id"), file.get("id"))
+                        for file in col.get("files") or []
+                    ],
+                )
+
+        return 0
+
+    def remove_memberships(self, collection_id, file_ids):
+        with self.conn:
+            self.conn.executemany(
+                "DELETE FROM memberships WHERE collection_id = ? AND file_id = ?",
+                [(collection_id, file_id) for file_id in file_ids],
+            )
+
+        return 0
+
+    def remove_file_ids(self, file_ids):
+        rows = [(file_id,) for file_id in file_ids]
+        with self.conn:
+            self.conn.executemany("DELETE FROM remote_files WHERE file_id = ?", rows)
+            self.conn.executemany("DELETE FROM memberships WHERE file_id = ?", rows)
+
+        return 0
+
+    def sha256_by_path(self):
+        return dict(self.conn.execute("SELECT path, sha256 FROM files"))
+
+    def sha256_by_file_id(self):
+        return dict(self.conn.execute("SELECT file_id, sha256 FROM remote_files"))
+
+    def skip_uploaded(self, collection_id, files_knowledge):
+        """
+        Pass through the files whose content is not yet in the collection,
+        logging how many were skipped at the end.
+
+        Returns:
+          generator of (path, size) tuples
+        """
+        rows = self.conn.execute(
+            "SELECT DISTINCT r.sha256 FROM remote_files r"
+            " JOIN memberships m ON m.file_id = r.file_id"
+            " WHERE m.collection_id = ?",
+            (collection_id,),
+        )
+        present = {sha256 for (sha256,) in rows}
+        skipped = 0
+        for path, size in files_knowledge:
+            row = self.conn.execute(
+                "SELECT sha256 FROM files WHERE path = ?", (path,)
+            ).fetchone()
+            if row and row[0] in present:
+                skipped += 1
+                continue
+            yield path, size
+
+        logger.info(f"Skipped {skipped} files already in the collection")
+
+    def uploaded_paths(self, collection_id):
+        """
+        Local path of each file ID the collection holds, for the files uploaded by this tool.
+
+        Returns:
+          dictionary of file ID to path
+        """
+        rows = self.conn.execute(
+            "SELECT r.file_id, r.path FROM remote_files r"
+            " JOIN memberships m ON m.file_id = r.file_id"
+            " WHERE m.collection_id = ?",
+            (collection_id,),
+        )
+        return dict(rows)
+
+    def orphan_file_ids(self):
+        """
+        Uploaded file IDs not held by any collection.
+        """
+        rows = self.conn.execute(
+            "SELECT file_id FROM remote_files"
+            " WHERE file_id NOT IN (SELECT file_id FROM memberships)"
+        )
+        return [file_id for (file_id,) in rows]
+
+    def duplicate_file_ids(self, collection_id):
+        """
+        File IDs of a collection holding the same content as an older upload in it.
+        """
+        rows = self.conn.execute(
+            "SELECT r.file_id FROM remote_files r"
+            " JOIN memberships m ON m.file_id = r.file_id"
+            " WHERE m.collection_id = ? AND EXISTS ("
+            "  SELECT 1 FROM remote_files r2"
+            "  JOIN memberships m2 ON m2.file_id = r2.file_id"
+            "  WHERE m2.collection_id = m.collection_id AND r2.sha256 = r.sha256"
+            "  AND (r2.uploaded_at < r.uploaded_at"
+            "   OR (r2.uploaded_at = r.uploaded_at AND r2.file_id < r.file_id)))",
+            (collection_id,),
+        )
+        return [file_id for (file_id,) in rows]
+
+    def report(self):
+        """
+        Counts of the indexed items.
+
+        Returns:
+          dictionary
+        """
+        counts = {}
+        for table in ("sources", "files", "remote_files", "collections", "memberships"):
+            counts[table] = self.conn.execute(
+                f"SELECT COUNT(*) FROM {table}"
+            ).fetchone()[0]
+        counts["orphans"] = len(self.orphan_file_ids())
+        counts["duplicates"] = sum(
+            len(self.duplicate_file_ids(collection_id))
+            for (collection_id,) in self.conn.execute(
+                "SELECT collection_id FROM collections"
+            ).fetchall()
+        )
+
+        return counts
+
+
+# one index connection per thread, sqlite3 connections cannot be shared across threads
+_local = threading.local()
+
+
+def get_index():
+    if getattr(_local, "index", None) is None:
+        _local.index = LocalIndex(
+            os.path.join(settings.base_knowledge_dir, settings.index_file)
+        )
+    return _local.index
+
+
+if __name__ == "__main__":
+    tmpx = None
@@ -0,0 +1,100 @@
+import time
+from utils import settings
+from utils.base_logger import logger
+
+
+def summarize(items, count=3):
+    """
+    Short representation of a possibly large list for log messages:
+    the first and last items and the number of items in between.
+
+    Args:
+      items: list
+      count: number of items to show at each end
+
+    Returns:
+      string
+    """
+    if len(items) <= count * 2:
+        return repr(items)
+    head = ", ".join(repr(item) for item in items[:count])
+    tail = ", ".join(repr(item) for item in items[-count:])
+
+    return (
+        f"[{head}, ... {len(items) - count * 2} more ..., {tail}] ({len(items)} items)"
+    )
+
+
+def format_bytes(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+class ProgressReporter:
+    """
+    Rate-limited progress line for loops over many items.
+
+    update() only increments counters and checks the clock, and a status
+    line with items/s, bytes/s, and ETA is logged at INFO level at most once
+    every settings.progress_interval seconds, plus once by finish().
+    """
+
+    def __init__(self, label, total=None, total_bytes=None, interval=None):
+        """
+        Args:
+          label: what is counted, e.g. "Files uploaded"
+          total: expected number of items, used for the ETA
+          total_bytes: expected number of bytes, preferred for the ETA when set
+          interval: seconds between status lines, defaults to settings.progress_interval
+        """
+        self.label = label
+        self.total = total
+        self.total_bytes = total_bytes
+        self.interval = settings.progress_interval if interval is None else interval
+        self.count = 0
+        self.bytes = 0
+        self.start = time.monotonic()
+        self.next_report = self.start + self.interval
+
+    def update(self, count=1, nbytes=0):
+        self.count += count
+        self.bytes += nbytes
+        now = time.monotonic()
+        if now >= self.next_report:
+            self.next_report = now + self.interval
+            self.report(now)
+
+    def report(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        elapsed = max(now - self.start, 1e-9)
+        count_rate = self.count / elapsed
+        byte_rate = self.bytes / elapsed
+
+        status = f"{self.label}: {self.count:,}"
+        if self.total is not None:
+            status += f"/{self.total:,}"
+        status += f" ({count_rate:,.1f}/s"
+        if self.bytes:
+            status += f", {format_bytes(byte_rate)}/s"
+
+        eta = None
+        if self.total_bytes and byte_rate > 0:
+            eta = (self.total_bytes - self.bytes) / byte_rate
+        elif self.total and count_rate > 0:
+            eta = (self.total - self.count) / count_rate
+        if eta is not None and eta > 0:
+            status += f", ETA {eta:,.0f}s"
+        status += ")"
+
+        logger.info(status)
+
+    def finish(self):
+        self.report()
+
+
+if __name__ == "__main__":
+    tmpx = None
@@ -5,3 +5,48 @@ def init():
     marker_file = ".marker_file"
     global env_file
     env_file = ".env"
+    # remote state cache: seconds to trust cached listings, and optional snapshot file
+    global cache_ttl
+    cache_ttl = 60
+    global cache_file
+    cache_file = None
+    # upload scheduler: concurrent uploads, in-flight byte budget, and per-file size limit
+    global upload_workers
+    upload_workers = 4
+    global upload_max_inflight_bytes
+    upload_max_inflight_bytes = 64 * 1024 * 1024
+    global upload_max_file_size
+    upload_max_file_size = 0
+    # number of collected files read ahead by the upload scheduler to choose from
+    global upload_window
+    upload_window = 256
+    # delta download: git remote base URL, bare mirrors directory, and state file
+    global git_remote
+    git_remote = "https://github.com"
+    global mirror_dir
+    mirror_dir = ".mirrors"
+    global delta_state_file
+    delta_state_file = ".delta_state"
+    # daemon: seconds between repository refreshes, and between local directory checks
+    global daemon_interval
+    daemon_interval = 300
+    global watch_interval
+    watch_interval = 10
+    # preprocessing: clean up and split text documents, compress upload requests
+    global preprocess
+    preprocess = False
+    global preprocess_dir
+    preprocess_dir = ".processed"
+    global preprocess_max_part_size
+    preprocess_max_part_size = 100 * 1024
+    global upload_compression
+    upload_compression = False
+    # seconds between progress status lines of long loops
+    global progress_interval
+    progress_interval = 5
+    # local SQLite index of sources, files, and remote file IDs, under base_knowledge_dir
+    global index_file
+    index_file = ".index.sqlite3"
+    # reconciliation: collections reconciled concurrently
+    global reconcile_workers
+    reconcile_workers = 4